@@ -0,0 +1,332 @@
+"""asyncio versions of the weather_service fetches, on one shared event loop.
+
+Every coroutine runs on a single daemon thread's loop with one aiohttp
+ClientSession (a keep-alive connection pool per host), so any number of
+Streamlit sessions and API requests can have calls in flight without a
+thread per request. Caching, quota scheduling, metrics and each lookup's
+keys and parsing (weather_service.CachedRequest) are weather_service's own;
+only the network I/O is different.
+
+Sync code goes through the wrappers at the bottom:
+
+    bundle = async_fetch.get_city_bundle("Delhi")                 # JSON, like /v1/weather
+    future = async_fetch.submit(async_fetch.fetch_aqi(lat, lon))  # concurrent.futures.Future
+    current = async_fetch.run(async_fetch.fetch_current("Delhi"))
+"""
+import asyncio
+import atexit
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+import weather_service
+from http_client import (
+    ENDPOINT_TIMEOUTS, DEFAULT_TIMEOUT, MAX_RETRIES, RETRY_STATUSES, CircuitOpenError, backoff_delay, get_client,
+)
+from weather_cache import make_key
+
+POOL_LIMIT = 100  # open connections in total
+POOL_PER_HOST = 32
+KEEPALIVE = 30  # seconds an idle connection is kept
+BUNDLE_DEADLINE = 10  # seconds for the sections of one bundle, after current weather
+
+
+class Response:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class AsyncHttpClient:
+    """aiohttp counterpart of http_client.HttpClient: same timeouts, retries, breakers and metrics.
+
+    Lives on the shared loop; the session is created there on first use.
+    """
+
+    def __init__(self, max_retries=MAX_RETRIES):
+        self.max_retries = max_retries
+        self._session = None
+
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=POOL_LIMIT, limit_per_host=POOL_PER_HOST,
+                                             keepalive_timeout=KEEPALIVE, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  headers={"User-Agent": "WeatherNow/1.0 (+streamlit)"})
+        return self._session
+
+    async def get(self, url, params=None, endpoint=None, timeout=None):
+        """GET with retries. Returns the final Response (any status) or raises."""
+        timeout = timeout or ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        client_timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        host = urlsplit(url).netloc
+        breaker = get_client().breaker(host)  # one breaker per host for both clients
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                metrics.record_upstream(endpoint, "circuit_open", 0, 0.0)
+                raise CircuitOpenError(f"circuit open for {host}")
+            last_attempt = attempt == self.max_retries
+            start = time.perf_counter()
+            try:
+                async with self.session().get(url, params=params, timeout=client_timeout) as response:
+                    result = Response(response.status, response.headers, await response.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                metrics.record_upstream(endpoint, status, 0, time.perf_counter() - start)
+                breaker.record_failure()
+                if last_attempt:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            metrics.record_upstream(endpoint, result.status, len(result.body), time.perf_counter() - start)
+            if result.status in RETRY_STATUSES:
+                breaker.record_failure()
+                if not last_attempt:
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+            else:
+                breaker.record_success()
+            return result
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+_loop = None
+_client = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """The shared event loop, running on its own daemon thread."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="weather-async", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def get_async_client():
+    """The process-wide AsyncHttpClient; call from the shared loop."""
+    global _client
+    if _client is None:
+        _client = AsyncHttpClient()
+    return _client
+
+
+@atexit.register
+def close():
+    """Close the shared session while the loop thread is still alive (avoids aiohttp's unclosed warnings)."""
+    if _client is not None and _loop is not None and _loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(_client.close(), _loop).result(timeout=2)
+        except Exception:
+            pass
+
+
+async def off_loop(fn, *args):
+    """Run a blocking helper (SQLite store reads and writes) on the default executor, keeping the trace."""
+    return await asyncio.get_running_loop().run_in_executor(None, metrics.bind(fn), *args)
+
+
+async def cached_fetch(endpoint, params, store_key, loader, force=False, store_ttl=None, model=None):
+    """weather_service.cached_fetch() with a coroutine loader.
+
+    Lookups (memory, then the local SQLite store) and writes both run off the loop.
+    """
+    if not force:
+        value = await off_loop(weather_service.recorded_lookup, endpoint, params, store_key, model)
+        if value is not None:
+            return value
+    value = await loader()
+    if value is not None:
+        await off_loop(weather_service.remember, endpoint, params, store_key, value, store_ttl)
+    return value
+
+
+# ---- OPENWEATHER ----
+async def openweather_get(path, endpoint, timeout=None, **params):
+    """weather_service.openweather_get() without blocking: same quota, coalescing keys and 429 handling."""
+    async def load():
+        response = await get_async_client().get(f"{weather_service.OPENWEATHER_URL}{path}",
+                                                params=dict(params, appid=weather_service.API_KEY),
+                                                endpoint=endpoint, timeout=timeout)
+        weather_service.check_rate_limit(response.status, response.headers)
+        return response.json()
+
+    return await weather_service.quota().call_async(make_key(path, params), load)
+
+
+async def fetch_request(request, force=False, timeout=None):
+    """weather_service.fetch_request() on the loop; the request's loaded callback runs off it."""
+    async def load():
+        res = await openweather_get(request.path, request.endpoint, timeout=timeout, **request.query)
+        value = request.parse(res)
+        if value is not None and request.loaded is not None:
+            await off_loop(request.loaded, value)
+        return value
+
+    return await cached_fetch(request.endpoint, request.params, request.store_key, load, force=force,
+                              store_ttl=request.store_ttl, model=request.model)
+
+
+async def fetch_current(city, timeout=None, force=False):
+    """CurrentWeather for city. Raises CityNotFoundError, UpstreamError, or the network error on failure."""
+    return await fetch_request(weather_service.current_request(city), force, timeout)
+
+
+async def fetch_onecall(lat, lon, force=False):
+    """(DailyOutlook, stale) like weather_service.fetch_onecall()."""
+    try:
+        res = await fetch_request(weather_service.onecall_request(lat, lon), force)
+        if res is not None:
+            return res, False
+    except Exception:
+        pass
+    return await off_loop(weather_service.stale_onecall, lat, lon)
+
+
+async def fetch_aqi(lat, lon, force=False):
+    """Raw AQI index (1-5) or None."""
+    try:
+        return await fetch_request(weather_service.aqi_request(lat, lon), force)
+    except Exception:
+        return None
+
+
+async def fetch_forecast(city=None, lat=None, lon=None, force=False):
+    """ForecastSeries for a city (or lat/lon), or None."""
+    try:
+        return await fetch_request(weather_service.forecast_request(city, lat, lon), force)
+    except Exception:
+        return None
+
+
+async def geocode_city(name):
+    """(lat, lon) like weather_service.geocode_city(); None if unknown."""
+    coords = await off_loop(weather_service.known_coords, name)
+    if coords is not None:
+        return coords
+    coords = await fetch_request(weather_service.geocode_request(name), force=True)
+    if not coords:
+        return None
+    return coords[0], coords[1]
+
+
+# ---- UNSPLASH ----
+async def search_unsplash(city_name):
+    """{"url": str|None} within the hourly budget, or None if we could not ask."""
+    budget = weather_service.unsplash_budget()
+    if not weather_service.UNSPLASH_ACCESS_KEY or not budget.acquire():
+        return None
+    try:
+        response = await get_async_client().get(weather_service.UNSPLASH_API_URL,
+                                                params=weather_service.unsplash_params(city_name), endpoint="unsplash")
+        budget.note_remaining(response.headers.get("X-Ratelimit-Remaining"))
+        if response.status >= 400:
+            return None
+        return weather_service.parse_unsplash(response.json())
+    except Exception:
+        return None
+
+
+async def fetch_unsplash_image_url(city_name):
+    """Landmark photo URL via shared cache -> persistent index -> Unsplash, else KNOWN_CITIES."""
+    entry, source = await off_loop(weather_service.lookup_image, city_name)
+    if source == "miss":
+        entry = await search_unsplash(city_name)
+        if entry is not None:
+            await off_loop(weather_service.remember_image, city_name, entry)
+    metrics.record_cache("unsplash", source)
+    return weather_service.image_url(city_name, entry)
+
+
+# ---- CITY BUNDLE ----
+SECTION_DEFAULTS = {"image": None, "aqi": None, "onecall": (None, False), "forecast": None}
+
+
+def section_coroutines(city, lat, lon, names=tuple(SECTION_DEFAULTS)):
+    """{section: coroutine} for the per-city fetches after current weather."""
+    makers = {
+        "image": lambda: fetch_unsplash_image_url(city),
+        "aqi": lambda: fetch_aqi(lat, lon),
+        "onecall": lambda: fetch_onecall(lat, lon),
+        "forecast": lambda: fetch_forecast(city),
+    }
+    return {name: makers[name]() for name in names}
+
+
+async def city_bundle(city, deadline=BUNDLE_DEADLINE):
+    """{"current", "image", "aqi", "onecall", "forecast"} for city, the sections fetched concurrently.
+
+    Raises what fetch_current raises; sections that fail or miss the deadline get their defaults.
+    """
+    current = await fetch_current(city)
+    tasks = {name: asyncio.ensure_future(coro)
+             for name, coro in section_coroutines(city, current.lat, current.lon).items()}
+    await asyncio.wait(tasks.values(), timeout=deadline)
+    bundle = {"current": current}
+    for name, task in tasks.items():
+        if task.done() and not task.cancelled() and task.exception() is None:
+            bundle[name] = task.result()
+        else:
+            task.cancel()
+            bundle[name] = SECTION_DEFAULTS[name]
+    return bundle
+
+
+async def city_bundle_json(city, deadline=BUNDLE_DEADLINE):
+    """city_bundle() as the /v1/weather JSON body, after the gazetteer check.
+    An upstream "not found" is re-raised with the gazetteer's suggestions."""
+    city = weather_service.bundle_query(city)
+    try:
+        bundle = await city_bundle(city, deadline)
+    except weather_service.CityNotFoundError as e:
+        raise weather_service.city_not_found(city, e) from e
+    weather_service.get_prefetcher().record(city)
+    return weather_service.bundle_json(city, **bundle)
+
+
+# ---- SYNC WRAPPERS ----
+async def _traced(coro, trace):
+    metrics.set_trace(trace)  # this task's context only
+    return await coro
+
+
+def submit(coro):
+    """Schedule coro on the shared loop from any thread; returns a concurrent.futures.Future.
+    The caller's metrics trace goes with it."""
+    return asyncio.run_coroutine_threadsafe(_traced(coro, metrics.current_trace()), get_loop())
+
+
+def run(coro, timeout=None):
+    """Block this thread (only) until coro finishes on the shared loop."""
+    future = submit(coro)
+    try:
+        return future.result(timeout=timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+
+def get_city_bundle(city, deadline=BUNDLE_DEADLINE):
+    """Current weather plus AQI, One Call, forecast and landmark image as plain JSON, in one call.
+
+    Raises CityNotFoundError / network errors from the current-weather lookup.
+    """
+    return run(city_bundle_json(city, deadline))
@@ -0,0 +1,224 @@
+"""Local stand-in for the OpenWeather and Unsplash APIs, used by the benchmarks.
+
+Serves the recorded responses in bench/fixtures/ with the city name and
+coordinates substituted, so every city gets its own cache keys. Latency and
+failures can be injected globally or per endpoint:
+
+    python bench/mock_server.py --port 8765 --latency 80 --jitter 40 --fail-rate 0.05
+
+Point the app at it with OPENWEATHER_BASE_URL=http://127.0.0.1:8765 and
+UNSPLASH_API_URL=http://127.0.0.1:8765/search/photos. Cities starting with
+"zz" answer 404 like an unknown city. GET /__stats returns request counts per
+endpoint and POST /__reset clears them.
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# request path -> (endpoint name, fixture file)
+ROUTES = {
+    "/data/2.5/weather": ("current", "weather.json"),
+    "/data/2.5/forecast": ("forecast", "forecast.json"),
+    "/data/2.5/onecall": ("onecall", "onecall.json"),
+    "/data/2.5/air_pollution": ("air_pollution", "air_pollution.json"),
+    "/geo/1.0/direct": ("geocoding", "direct.json"),
+    "/search/photos": ("unsplash", "unsplash.json"),
+}
+
+
+def load_fixtures():
+    fixtures = {}
+    for endpoint, filename in ROUTES.values():
+        with open(os.path.join(FIXTURES_DIR, filename), "r", encoding="utf-8") as f:
+            fixtures[endpoint] = json.load(f)
+    return fixtures
+
+
+def city_coords(name):
+    """Stable fake coordinates for a city name, so lat/lon caches see distinct keys."""
+    digest = hashlib.sha1(" ".join(name.split()).lower().encode("utf-8")).digest()
+    lat = round(-60 + digest[0] / 255 * 120 + digest[1] / 25500, 4)
+    lon = round(-180 + digest[2] / 255 * 360 + digest[3] / 25500, 4)
+    return lat, lon
+
+
+class Faults:
+    """Latency (ms) and failure injection; per-endpoint values override the defaults."""
+
+    def __init__(self, latency=0.0, jitter=0.0, fail_rate=0.0, fail_status=503, per_endpoint=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.per_endpoint = per_endpoint or {}
+
+    def option(self, endpoint, name):
+        return self.per_endpoint.get(endpoint, {}).get(name, getattr(self, name))
+
+    def delay(self, endpoint):
+        latency = self.option(endpoint, "latency")
+        jitter = self.option(endpoint, "jitter")
+        return max(0.0, latency + random.uniform(-jitter, jitter)) / 1000.0
+
+    def should_fail(self, endpoint):
+        return random.random() < self.option(endpoint, "fail_rate")
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, faults=None):
+        super().__init__(address, MockHandler)
+        self.faults = faults or Faults()
+        self.fixtures = load_fixtures()
+        self.counts = {}
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def count(self, endpoint, failed):
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            if failed:
+                self.failures[endpoint] = self.failures.get(endpoint, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {"requests": dict(self.counts), "failures": dict(self.failures), "total": sum(self.counts.values())}
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.failures.clear()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="mock-api", daemon=True).start()
+        return self
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if self.path == "/__reset":
+            self.server.reset()
+            self.send_json(200, {"ok": True})
+        else:
+            self.send_json(404, {"message": "not found"})
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == "/__stats":
+            self.send_json(200, self.server.stats())
+            return
+        route = ROUTES.get(parts.path)
+        if route is None:
+            self.send_json(404, {"cod": "404", "message": "unknown path"})
+            return
+        endpoint = route[0]
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        faults = self.server.faults
+        time.sleep(faults.delay(endpoint))
+        if faults.should_fail(endpoint):
+            self.server.count(endpoint, True)
+            status = faults.option(endpoint, "fail_status")
+            headers = {"Retry-After": "2"} if status == 429 else None
+            self.send_json(status, {"cod": str(status), "message": "injected failure"}, headers)
+            return
+        self.server.count(endpoint, False)
+        status, body = self.respond(endpoint, query)
+        headers = {"X-Ratelimit-Remaining": "1000"} if endpoint == "unsplash" else None
+        self.send_json(status, body, headers)
+
+    def respond(self, endpoint, query):
+        body = copy.deepcopy(self.server.fixtures[endpoint])
+        name = query.get("q", "")
+        if endpoint in ("current", "forecast", "geocoding") and name.lower().startswith("zz"):
+            if endpoint == "geocoding":
+                return 200, []
+            return 404, {"cod": "404", "message": "city not found"}
+        if name:
+            lat, lon = city_coords(name)
+        else:
+            lat, lon = float(query.get("lat", 0)), float(query.get("lon", 0))
+        if endpoint == "current":
+            body.update(name=name.title(), coord={"lat": lat, "lon": lon})
+        elif endpoint == "forecast":
+            body["city"].update(name=name.title(), coord={"lat": lat, "lon": lon})
+        elif endpoint == "geocoding":
+            body[0].update(name=name.title(), lat=lat, lon=lon)
+        elif endpoint == "onecall":
+            body.update(lat=lat, lon=lon)
+        elif endpoint == "air_pollution":
+            body["coord"] = {"lat": lat, "lon": lon}
+        return 200, body
+
+
+def parse_endpoint_faults(values):
+    """["forecast:latency=300", "onecall:fail_rate=0.5"] -> {"forecast": {"latency": 300.0}, ...}"""
+    per_endpoint = {}
+    for value in values or []:
+        endpoint, _, setting = value.partition(":")
+        name, _, number = setting.partition("=")
+        cast = int if name == "fail_status" else float
+        per_endpoint.setdefault(endpoint, {})[name] = cast(number)
+    return per_endpoint
+
+
+def add_fault_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="mean added latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- uniform jitter in ms")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--endpoint-fault", action="append", metavar="ENDPOINT:NAME=VALUE",
+                        help="per-endpoint override, e.g. forecast:latency=300 (repeatable)")
+
+
+def faults_from_args(args):
+    return Faults(args.latency, args.jitter, args.fail_rate, args.fail_status,
+                  parse_endpoint_faults(args.endpoint_fault))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenWeather/Unsplash stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    server = MockServer((args.host, args.port), faults_from_args(args))
+    print(f"mock API on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
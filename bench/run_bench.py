@@ -0,0 +1,232 @@
+"""Page-load benchmark against the local mock API (no network needed).
+
+    python bench/run_bench.py                          # service layer, 200 loads
+    python bench/run_bench.py --driver apptest --iterations 50
+    python bench/run_bench.py --latency 80 --jitter 40 --fail-rate 0.05
+    python bench/run_bench.py --json baseline.json     # on a known-good commit
+    python bench/run_bench.py --baseline baseline.json
+
+Cities are drawn with a Zipf-like popularity (a few hot cities, a long tail)
+so both cold and warm loads are measured. Each run gets a fresh cache
+database in a temporary directory. With --baseline, exits 1 if p95 got more
+than --tolerance slower or a page needs more outbound requests than before.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_server import MockServer, add_fault_arguments, faults_from_args  # noqa: E402
+
+CITY_POOL = [
+    "Delhi", "Mumbai", "London", "Paris", "Tokyo", "New York", "Sydney", "Berlin", "Toronto", "Dubai",
+    "Singapore", "Amritsar", "Chandigarh", "Pune", "Jaipur", "Madrid", "Rome", "Cairo", "Nairobi", "Lima",
+    "Seoul", "Bangkok", "Istanbul", "Moscow", "Lagos", "Santiago", "Oslo", "Dublin", "Vienna", "Prague",
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies):
+    if not latencies:
+        return None
+    ms = [v * 1000 for v in latencies]
+    return {
+        "count": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 2),
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(max(ms), 2),
+    }
+
+
+def workload(cities, iterations, miss_rate, seed):
+    """Zipf-weighted city sequence; miss_rate of the loads ask for an unknown city."""
+    rng = random.Random(seed)
+    pool = CITY_POOL[:cities] if cities <= len(CITY_POOL) else CITY_POOL + [f"Town {i}" for i in range(cities - len(CITY_POOL))]
+    weights = [1.0 / (rank + 1) for rank in range(len(pool))]
+    sequence = []
+    for _ in range(iterations):
+        if rng.random() < miss_rate:
+            sequence.append(f"zz{rng.randrange(10 ** 6)}")
+        else:
+            sequence.append(rng.choices(pool, weights)[0])
+    return sequence
+
+
+def drive_service(sequence):
+    from async_fetch import get_city_bundle
+    from weather_service import CityNotFoundError
+
+    def load(city):
+        try:
+            get_city_bundle(city)
+            return True
+        except CityNotFoundError:
+            return True
+        except Exception:
+            return False
+
+    return [timed(load, city) for city in sequence]
+
+
+def drive_apptest(sequence, keys):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_DIR, "new.py"), default_timeout=60)
+    at.secrets["OPENWEATHER_API_KEY"] = keys[0]
+    at.secrets["UNSPLASH_ACCESS_KEY"] = keys[1]
+    at.run()
+
+    def load(city):
+        box = at.selectbox(key="city_input")
+        if city not in box.options:
+            box.options.append(city)  # what typing a name that isn't offered sends
+        box.set_value(city)
+        # same state the search box's on_change sets, so repeated cities reload too
+        at.session_state["search_triggered"] = True
+        at.session_state["current_weather_data"] = None
+        at.run()
+        return not at.exception
+
+    return [timed(load, city) for city in sequence]
+
+
+def timed(load, city):
+    start = time.perf_counter()
+    ok = load(city)
+    return city, time.perf_counter() - start, ok
+
+
+def http_json(url, method="GET"):
+    request = urllib.request.Request(url, method=method)
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def run(args):
+    server = MockServer(("127.0.0.1", 0), faults_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix="weather-bench-")
+    keys = ("bench-key", "bench-unsplash")
+    os.environ.update({
+        "OPENWEATHER_BASE_URL": server.url,
+        "UNSPLASH_API_URL": server.url + "/search/photos",
+        "OPENWEATHER_API_KEY": keys[0],
+        "UNSPLASH_ACCESS_KEY": keys[1],
+        "WEATHER_CACHE_DB": os.path.join(workdir, "cache.sqlite3"),
+    })
+    if not args.prefetch:
+        # the refresher would add background requests to the counts
+        os.environ["PREFETCH_BUDGET_PER_MINUTE"] = "0"
+    os.chdir(workdir)  # favourites.json and the legacy cache.json resolve against cwd
+
+    sequence = workload(args.cities, args.iterations, args.miss_rate, args.seed)
+    started = time.perf_counter()
+    if args.driver == "apptest":
+        results = drive_apptest(sequence, keys)
+    else:
+        results = drive_service(sequence)
+    wall = time.perf_counter() - started
+
+    from weather_cache import shared_cache
+
+    seen = set()
+    cold, warm = [], []
+    for city, seconds, _ in results:
+        (warm if city in seen else cold).append(seconds)
+        seen.add(city)
+    upstream = http_json(server.url + "/__stats")
+    server.shutdown()
+    return {
+        "driver": args.driver,
+        "iterations": len(results),
+        "unique_cities": len(seen),
+        "faults": {"latency_ms": args.latency, "jitter_ms": args.jitter, "fail_rate": args.fail_rate},
+        "wall_s": round(wall, 3),
+        "page": summarize([r[1] for r in results]),
+        "cold": summarize(cold),
+        "warm": summarize(warm),
+        "errors": sum(1 for r in results if not r[2]),
+        "upstream": upstream,
+        "requests_per_page": round(upstream["total"] / max(1, len(results)), 3),
+        "cache": shared_cache().stats(),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Regression messages (empty if none)."""
+    problems = []
+    old, new = baseline["page"]["p95_ms"], report["page"]["p95_ms"]
+    if new > old * (1 + tolerance):
+        problems.append(f"p95 {new:.1f} ms vs baseline {old:.1f} ms (+{(new / old - 1) * 100:.0f}%)")
+    if report["requests_per_page"] > baseline["requests_per_page"] * (1 + tolerance):
+        problems.append(f"{report['requests_per_page']} upstream requests/page vs baseline {baseline['requests_per_page']}")
+    return problems
+
+
+def print_report(report):
+    print(f"driver={report['driver']} loads={report['iterations']} cities={report['unique_cities']} "
+          f"wall={report['wall_s']}s errors={report['errors']}")
+    for name in ("page", "cold", "warm"):
+        s = report[name]
+        if s:
+            print(f"  {name:<5} n={s['count']:<5} p50={s['p50_ms']:>8.2f}  p95={s['p95_ms']:>8.2f}  "
+                  f"p99={s['p99_ms']:>8.2f}  max={s['max_ms']:>8.2f} ms")
+    upstream = report["upstream"]
+    per_endpoint = ", ".join(f"{k}={v}" for k, v in sorted(upstream["requests"].items()))
+    print(f"  upstream requests={upstream['total']} ({report['requests_per_page']}/page): {per_endpoint}")
+    if upstream["failures"]:
+        print(f"  injected failures: {upstream['failures']}")
+    cache = report["cache"]
+    print(f"  memory cache hit rate={cache['hit_rate']:.1%} (hits={cache['hits']} misses={cache['misses']} "
+          f"entries={cache['entries']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weather Now page-load benchmark")
+    parser.add_argument("--driver", choices=("service", "apptest"), default="service")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--miss-rate", type=float, default=0.0, help="fraction of loads for unknown cities")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--prefetch", action="store_true", help="leave the background refresher enabled")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="earlier --json report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    # run() changes into a temporary directory
+    args.json = os.path.abspath(args.json) if args.json else None
+    args.baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print("REGRESSION:", problem)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
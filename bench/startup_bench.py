@@ -0,0 +1,169 @@
+"""Cold-start benchmark: import cost and first render of the welcome page.
+
+    python bench/startup_bench.py                      # 5 fresh interpreters
+    python bench/startup_bench.py --top 25             # longer -X importtime table
+    python bench/startup_bench.py --json startup.json  # on a known-good commit
+    python bench/startup_bench.py --baseline startup.json
+
+Each run starts a new `python -X importtime` that renders new.py once with
+Streamlit's AppTest: no city searched, so only the search box and the welcome
+page are drawn (against the local mock API, no network needed). The import
+lines the app itself triggers are summed and the slowest top-level ones are
+listed. Exits 1 if a module in LAZY_MODULES was imported before a map or chart
+was shown, or, with --baseline, if the first render or the app's import time got
+more than --tolerance slower.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_server import MockServer  # noqa: E402
+
+# only needed once a map or chart is rendered; must stay out of the welcome page
+LAZY_MODULES = ("folium", "matplotlib")
+APP_MARKER = "--- app run ---"
+
+# runs in the child interpreter: argv = [app path, *LAZY_MODULES]
+DRIVER = f"""
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+harness = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+at.secrets["OPENWEATHER_API_KEY"] = "bench-key"
+at.secrets["UNSPLASH_ACCESS_KEY"] = "bench-unsplash"
+print({APP_MARKER!r}, file=sys.stderr, flush=True)
+at.run()
+done = time.perf_counter()
+lazy = set(sys.argv[2:])
+print(json.dumps({{
+    "harness_s": harness - started,
+    "first_run_s": done - harness,
+    "errors": len(at.exception),
+    "lazy_loaded": sorted(m for m in sys.modules if m.split(".")[0] in lazy),
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Top-level imports made after APP_MARKER: [(module, self_us, cumulative_us)]."""
+    imports, in_app = [], False
+    for line in stderr.splitlines():
+        if line == APP_MARKER:
+            in_app = True
+            continue
+        if not in_app or not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the column header
+        name = fields[2][1:]
+        if name.startswith(" "):
+            continue  # nested: already counted in its parent's cumulative time
+        imports.append((name, int(fields[0]), int(fields[1])))
+    return imports
+
+
+def run_once(env, workdir):
+    app = os.path.join(REPO_DIR, "new.py")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", DRIVER, app, *LAZY_MODULES],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=300,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"driver failed ({proc.returncode}):\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["imports"] = parse_importtime(proc.stderr)
+    result["app_import_s"] = sum(cumulative for _, _, cumulative in result["imports"]) / 1e6
+    return result
+
+
+def run(args):
+    server = MockServer(("127.0.0.1", 0)).start()
+    results = []
+    for _ in range(args.runs):
+        # a fresh cache database (and favourites file) per run, as on a new deployment
+        workdir = tempfile.mkdtemp(prefix="weather-startup-")
+        env = dict(os.environ,
+                   OPENWEATHER_BASE_URL=server.url,
+                   UNSPLASH_API_URL=server.url + "/search/photos",
+                   WEATHER_CACHE_DB=os.path.join(workdir, "cache.sqlite3"),
+                   PREFETCH_BUDGET_PER_MINUTE="0")
+        results.append(run_once(env, workdir))
+    server.shutdown()
+
+    slowest = {}
+    for result in results:
+        for name, _, cumulative in result["imports"]:
+            slowest.setdefault(name, []).append(cumulative / 1000)
+    top = sorted(((statistics.median(ms), name) for name, ms in slowest.items()), reverse=True)[:args.top]
+    return {
+        "runs": len(results),
+        "first_run_ms": round(statistics.median(r["first_run_s"] for r in results) * 1000, 1),
+        "app_import_ms": round(statistics.median(r["app_import_s"] for r in results) * 1000, 1),
+        "harness_ms": round(statistics.median(r["harness_s"] for r in results) * 1000, 1),
+        "errors": sum(r["errors"] for r in results),
+        "lazy_loaded": sorted({m for r in results for m in r["lazy_loaded"]}),
+        "top_imports": [{"module": name, "cumulative_ms": round(ms, 1)} for ms, name in top],
+    }
+
+
+def check(report, baseline=None, tolerance=0.2):
+    """Problem messages (empty if none)."""
+    problems = []
+    if report["lazy_loaded"]:
+        problems.append("welcome page imported " + ", ".join(report["lazy_loaded"]))
+    if report["errors"]:
+        problems.append(f"{report['errors']} exceptions on the welcome page")
+    if baseline:
+        for name in ("first_run_ms", "app_import_ms"):
+            old, new = baseline[name], report[name]
+            if new > old * (1 + tolerance):
+                problems.append(f"{name} {new:.1f} vs baseline {old:.1f} (+{(new / old - 1) * 100:.0f}%)")
+    return problems
+
+
+def print_report(report):
+    print(f"runs={report['runs']} first render={report['first_run_ms']:.1f} ms "
+          f"app imports={report['app_import_ms']:.1f} ms (AppTest harness {report['harness_ms']:.1f} ms, not counted)")
+    print("  slowest top-level imports during the first render (median cumulative, -X importtime):")
+    for entry in report["top_imports"]:
+        print(f"    {entry['cumulative_ms']:>9.1f} ms  {entry['module']}")
+    print("  lazy modules loaded: " + (", ".join(report["lazy_loaded"]) or "none"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weather Now cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="imports listed in the report")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="earlier --json report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    problems = check(report, baseline, args.tolerance)
+    for problem in problems:
+        print("REGRESSION:", problem)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Persistent offline cache backed by SQLite in WAL mode.
+
+Replaces the old cache.json, which was rewritten in full on every fetch. Each
+write here is a single-row upsert, reads are indexed lookups, entries expire
+by TTL, and WAL lets many sessions (and processes) read while one writes.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL = 7 * 24 * 3600  # offline copies are useful for about a week
+PURGE_EVERY = 200  # writes between expiry sweeps
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    data TEXT NOT NULL
+)
+"""
+
+
+class CacheStore:
+    def __init__(self, path, default_ttl=DEFAULT_TTL):
+        self.path = path
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute(_SCHEMA)
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at)")
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 connections must not be shared between threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, key, data, ttl=None):
+        now = time.time()
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, stored_at, expires_at, data) VALUES (?, ?, ?, ?)",
+                (key, now, expires, payload),
+            )
+        with self._write_lock:
+            self._writes += 1
+            sweep = self._writes % PURGE_EVERY == 0
+        if sweep:
+            self.purge_expired()
+
+    def get_entry(self, key):
+        """Return (data, stored_at) for an unexpired key, else (None, None)."""
+        row = self._conn().execute(
+            "SELECT data, stored_at FROM entries WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None, None
+        try:
+            return json.loads(row[0]), row[1]
+        except ValueError:
+            return None, None
+
+    def get(self, key):
+        return self.get_entry(key)[0]
+
+    def purge_expired(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+
+    def import_legacy_json(self, json_path):
+        """One-time migration of the old cache.json; the file is renamed afterwards."""
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception:
+            return 0
+        count = 0
+        if isinstance(legacy, dict):
+            for key, entry in legacy.items():
+                if isinstance(entry, dict) and entry.get("data"):
+                    self.put(key, entry["data"])
+                    count += 1
+        try:
+            os.replace(json_path, json_path + ".migrated")
+        except OSError:
+            pass
+        return count
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(path, legacy_json=None):
+    """One CacheStore per path for the whole process; legacy_json is migrated on first open."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = CacheStore(path)
+            if legacy_json:
+                store.import_legacy_json(legacy_json)
+            _stores[path] = store
+        return store
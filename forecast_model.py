@@ -0,0 +1,268 @@
+"""Compact records for the data the app actually displays.
+
+OpenWeather payloads are converted once, at ingestion. After that the caches,
+the offline store and st.session_state hold only these small objects, and
+the renderers read plain attributes instead of indexing nested dicts.
+
+Each record has from_api() (raw OpenWeather JSON), to_dict() (for the SQLite
+store and the JSON API) and from_dict(). from_dict() also accepts the raw
+payloads that older versions wrote to the offline store.
+"""
+import hashlib
+import sys
+from array import array
+
+import numpy as np
+
+DAY = 86400
+FULL_DAY_STEPS = 8  # three-hour steps in a whole calendar day
+
+
+def _intern(value):
+    return sys.intern(str(value))
+
+
+class CurrentWeather:
+    """/data/2.5/weather, reduced to what the summary card and dashboard show."""
+    __slots__ = ("name", "lat", "lon", "temp", "feels_like", "humidity", "pressure", "wind_speed",
+                 "condition", "description", "sunrise", "sunset", "timezone")
+
+    def __init__(self, name, lat, lon, temp, feels_like, humidity, pressure, wind_speed,
+                 condition, description, sunrise, sunset, timezone):
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.temp = temp
+        self.feels_like = feels_like
+        self.humidity = humidity
+        self.pressure = pressure
+        self.wind_speed = wind_speed
+        self.condition = condition  # lower-case group, e.g. "rain"
+        self.description = description  # title-cased, e.g. "Light Rain"
+        self.sunrise = sunrise  # unix seconds, UTC
+        self.sunset = sunset
+        self.timezone = timezone  # offset from UTC in seconds
+
+    @classmethod
+    def from_api(cls, res):
+        main, weather = res["main"], res["weather"][0]
+        return cls(
+            name=res.get("name", ""),
+            lat=float(res["coord"]["lat"]),
+            lon=float(res["coord"]["lon"]),
+            temp=float(main["temp"]),
+            feels_like=float(main.get("feels_like", main["temp"])),
+            humidity=main.get("humidity", 0),
+            pressure=main.get("pressure", 0),
+            wind_speed=float(res.get("wind", {}).get("speed", 0)),
+            condition=_intern(weather["main"].lower()),
+            description=weather["description"].title(),
+            sunrise=res.get("sys", {}).get("sunrise", 0),
+            sunset=res.get("sys", {}).get("sunset", 0),
+            timezone=res.get("timezone", 0),
+        )
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            return None
+        try:
+            if "main" in data:  # raw payload from an older offline store
+                return cls.from_api(data)
+            return cls(**{slot: data[slot] for slot in cls.__slots__})
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+
+
+class ForecastSeries:
+    """/data/2.5/forecast (40 three-hour steps) as parallel columns."""
+    __slots__ = ("timezone", "dt", "temp", "precip", "condition", "description", "_daily", "_fingerprint")
+
+    def __init__(self, timezone, dt, temp, precip, condition, description):
+        self.timezone = timezone  # offset from UTC in seconds
+        self.dt = array("q", dt)  # unix seconds, UTC
+        self.temp = array("d", temp)
+        self.precip = array("d", precip)  # rain + snow over the 3 hours, mm
+        self.condition = tuple(_intern(c) for c in condition)
+        self.description = tuple(_intern(d) for d in description)
+        self._daily = None
+        self._fingerprint = None
+
+    def __len__(self):
+        return len(self.dt)
+
+    def local_dt(self):
+        """Step times shifted into the city's local time (still unix seconds)."""
+        return np.frombuffer(self.dt, dtype=np.int64) + self.timezone
+
+    def fingerprint(self):
+        """Short content hash, for memoizing things rendered from this series."""
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(str(self.timezone).encode())
+            for column in (self.dt, self.temp, self.precip):
+                digest.update(column.tobytes())
+            digest.update("\x1f".join(self.condition + self.description).encode("utf-8"))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def daily(self):
+        """DailySummary of this series, computed on first use and kept with the record."""
+        if self._daily is None:
+            self._daily = DailySummary.from_series(self)
+        return self._daily
+
+    @classmethod
+    def from_api(cls, res):
+        dt, temp, precip, condition, description = [], [], [], [], []
+        for info in res.get("list", []):
+            dt.append(info["dt"])
+            temp.append(info["main"]["temp"])
+            precip.append(info.get("rain", {}).get("3h", 0.0) + info.get("snow", {}).get("3h", 0.0))
+            condition.append(info["weather"][0]["main"].lower())
+            description.append(info["weather"][0]["description"].title())
+        return cls(res.get("city", {}).get("timezone", 0), dt, temp, precip, condition, description)
+
+    def to_dict(self):
+        return {
+            "timezone": self.timezone,
+            "dt": self.dt.tolist(),
+            "temp": self.temp.tolist(),
+            "precip": self.precip.tolist(),
+            "condition": list(self.condition),
+            "description": list(self.description),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            return None
+        try:
+            if "list" in data:
+                return cls.from_api(data)
+            return cls(data["timezone"], data["dt"], data["temp"], data["precip"],
+                       data["condition"], data["description"])
+        except (KeyError, IndexError, TypeError, ValueError):
+            # includes the old {"entries": [...]} format, which had no timestamps; refetch it
+            return None
+
+
+class DailySummary:
+    """Forecast steps grouped into local calendar days: min/max/mean temperature,
+    total precipitation and the most frequent condition per day."""
+    __slots__ = ("day", "temp_min", "temp_max", "temp_mean", "precip", "steps", "condition", "description")
+
+    def __init__(self, day, temp_min, temp_max, temp_mean, precip, steps, condition, description):
+        self.day = day  # local midnight of each day, as unix seconds (format with utcfromtimestamp)
+        self.temp_min = temp_min
+        self.temp_max = temp_max
+        self.temp_mean = temp_mean
+        self.precip = precip
+        self.steps = steps  # forecast steps that fell on the day (FULL_DAY_STEPS for a full day)
+        self.condition = condition
+        self.description = description
+
+    def __len__(self):
+        return len(self.day)
+
+    def partial(self):
+        """Boolean array: days the forecast only partly covers (usually its first and last)."""
+        return self.steps < FULL_DAY_STEPS
+
+    def select(self, mask):
+        """A DailySummary of the days where mask is true."""
+        index = np.flatnonzero(mask)
+        return DailySummary(
+            self.day[index], self.temp_min[index], self.temp_max[index], self.temp_mean[index],
+            self.precip[index], self.steps[index],
+            tuple(self.condition[i] for i in index.tolist()),
+            tuple(self.description[i] for i in index.tolist()),
+        )
+
+    @classmethod
+    def from_series(cls, series):
+        if not len(series):
+            empty = np.empty(0)
+            return cls(empty.astype(np.int64), empty, empty, empty, empty, empty.astype(np.int64), (), ())
+        day_index = series.local_dt() // DAY
+        temp = np.frombuffer(series.temp, dtype=np.float64)
+        precip = np.frombuffer(series.precip, dtype=np.float64)
+        # steps are in time order, so each day is one contiguous run
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(day_index)) + 1))
+        steps = np.diff(np.append(starts, len(day_index)))
+        sums = np.add.reduceat(temp, starts)
+
+        # dominant condition: count (day, condition) pairs, take the most frequent per day
+        names, codes = np.unique(np.array(series.condition), return_inverse=True)
+        group = np.repeat(np.arange(len(starts)), steps)
+        counts = np.bincount(group * len(names) + codes, minlength=len(starts) * len(names))
+        dominant = counts.reshape(len(starts), len(names)).argmax(axis=1)
+        condition = tuple(_intern(names[c]) for c in dominant)
+        # describe each day with the first step that has its dominant condition
+        description = tuple(
+            series.description[start + series.condition[start:start + n].index(cond)]
+            for start, n, cond in zip(starts.tolist(), steps.tolist(), condition)
+        )
+        return cls(
+            day=day_index[starts] * DAY,
+            temp_min=np.minimum.reduceat(temp, starts),
+            temp_max=np.maximum.reduceat(temp, starts),
+            temp_mean=sums / steps,
+            precip=np.add.reduceat(precip, starts),
+            steps=steps,
+            condition=condition,
+            description=description,
+        )
+
+    def to_dict(self):
+        return {
+            "day": self.day.tolist(),
+            "temp_min": self.temp_min.tolist(),
+            "temp_max": self.temp_max.tolist(),
+            "temp_mean": np.round(self.temp_mean, 2).tolist(),
+            "precip": np.round(self.precip, 2).tolist(),
+            "steps": self.steps.tolist(),
+            "condition": list(self.condition),
+            "description": list(self.description),
+        }
+
+
+class DailyOutlook:
+    """One Call: the UV index now and the daily day-temperatures for the trend chart."""
+    __slots__ = ("uvi", "dt", "temp_day")
+
+    def __init__(self, uvi, dt, temp_day):
+        self.uvi = uvi
+        self.dt = array("q", dt)
+        self.temp_day = array("d", temp_day)
+
+    @classmethod
+    def from_api(cls, res):
+        daily = res.get("daily") or []
+        return cls(
+            res.get("current", {}).get("uvi"),
+            [d["dt"] for d in daily],
+            [d["temp"]["day"] for d in daily],
+        )
+
+    def to_dict(self):
+        return {"uvi": self.uvi, "dt": self.dt.tolist(), "temp_day": self.temp_day.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            return None
+        try:
+            if "daily" in data:
+                return cls.from_api(data)
+            return cls(data["uvi"], data["dt"], data["temp_day"])
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+
+
+def to_json(value):
+    """Plain JSON form of a record (or the value unchanged)."""
+    return value.to_dict() if hasattr(value, "to_dict") else value
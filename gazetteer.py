@@ -0,0 +1,271 @@
+"""Local city gazetteer: what the user typed is matched against known cities
+before anything is sent to OpenWeather, and the search box gets suggestions.
+
+data/cities.csv bundles a few hundred large cities. GAZETTEER_FILE can point
+at a bigger list instead: the same CSV columns, or a GeoNames dump such as
+cities15000.txt (tab separated, .txt). Names are folded (case, accents,
+punctuation) and kept in one sorted list for prefix lookups, with a trigram
+index on top for near misses ("Dehli", "Amritsr").
+"""
+import bisect
+import csv
+import os
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SEED_FILE = os.path.join(DATA_DIR, "cities.csv")
+COUNTRIES_FILE = os.path.join(DATA_DIR, "countries.csv")
+GAZETTEER_FILE = os.environ.get("GAZETTEER_FILE", "")
+
+PREFIX_SCAN = 200  # keys looked at per prefix lookup; ranked by population afterwards
+FUZZY_CANDIDATES = 50  # keys sharing the most trigrams that get an edit-distance check
+# Country names refused as a search (the app's original list). Any other country name goes
+# upstream like a city: OpenWeather answers many of them with the capital ("Kuwait", "Panama").
+REJECTED_COUNTRIES = frozenset({
+    "india", "usa", "china", "canada", "brazil", "russia", "germany", "france",
+    "japan", "australia", "uk", "italy", "spain", "mexico", "pakistan", "indonesia",
+})
+
+
+def fold(text):
+    """Search form of a name: lower-case ASCII letters and digits, single spaces."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return " ".join("".join(c if c.isalnum() else " " for c in text.lower()).split())
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(key):
+    return 1 if len(key) <= 5 else 2
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance counting a swap of neighbours as one edit; limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+class City:
+    __slots__ = ("id", "name", "country", "lat", "lon", "population")
+
+    def __init__(self, id, name, country, lat, lon, population):
+        self.id = id
+        self.name = name
+        self.country = country  # ISO 3166 alpha-2
+        self.lat = lat
+        self.lon = lon
+        self.population = population
+
+    @property
+    def label(self):
+        return f"{self.name}, {self.country}"
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class Gazetteer:
+    def __init__(self):
+        self.cities = []  # City records; everything below refers to them by position
+        self._pending = []  # (folded key, city position) until build()
+        self._keys = []  # sorted folded names, alternate names included
+        self._owners = array("I")  # city position of each key
+        self._trigrams = {}  # trigram -> array of key positions
+        self._countries = {}  # folded country name or alias -> code
+        self._codes = set()
+
+    def __len__(self):
+        return len(self.cities)
+
+    # ---- loading ----
+    def add(self, city, alt_names=()):
+        position = len(self.cities)
+        self.cities.append(city)
+        for name in {fold(city.name), *(fold(a) for a in alt_names)}:
+            if name:
+                self._pending.append((name, position))
+
+    def load_csv(self, path):
+        """id,name,country,lat,lon,population,alt_names (alternate names separated by |)."""
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    city = City(int(row["id"]), row["name"], row["country"].upper(),
+                                float(row["lat"]), float(row["lon"]), int(row.get("population") or 0))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                self.add(city, (row.get("alt_names") or "").split("|"))
+
+    def load_geonames(self, path):
+        """GeoNames cities dump: geonameid, name, asciiname, alternatenames, lat, lon, ..., country, ..., population."""
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                cols = line.rstrip("\n").split("\t")
+                try:
+                    city = City(int(cols[0]), cols[1], cols[8].upper(), float(cols[4]), float(cols[5]),
+                                int(cols[14] or 0))
+                except (IndexError, ValueError):
+                    continue
+                # alternate names include every script; keep the ones that fold to something
+                self.add(city, [cols[2]] + cols[3].split(","))
+
+    def load_file(self, path):
+        if path.endswith(".txt"):
+            self.load_geonames(path)
+        else:
+            self.load_csv(path)
+
+    def load_countries(self, path):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                code = row["code"].upper()
+                self._codes.add(code)
+                for name in [row["name"]] + (row.get("aliases") or "").split("|"):
+                    if fold(name):
+                        self._countries[fold(name)] = code
+
+    def build(self):
+        """Sort the keys and index their trigrams; call once after loading."""
+        pairs = sorted(set(self._pending) | set(zip(self._keys, self._owners)))
+        self._pending = []
+        self._keys = [key for key, _ in pairs]
+        self._owners = array("I", (owner for _, owner in pairs))
+        postings = {}
+        for position, key in enumerate(self._keys):
+            for gram in trigrams(key):
+                postings.setdefault(gram, []).append(position)
+        self._trigrams = {gram: array("I", positions) for gram, positions in postings.items()}
+        return self
+
+    # ---- lookups ----
+    def _split_country(self, query):
+        """"London, CA" -> ("london", "CA"); no recognised country -> (folded query, None)."""
+        name, comma, rest = str(query).rpartition(",")
+        rest = fold(rest)
+        if comma and fold(name):
+            if rest.upper() in self._codes:
+                return fold(name), rest.upper()
+            if rest in self._countries:
+                return fold(name), self._countries[rest]
+        return fold(query), None
+
+    def _ranked(self, positions, country=None, limit=None):
+        """Distinct cities of the given key positions, most populous first."""
+        seen, found = set(), []
+        for position in positions:
+            owner = self._owners[position]
+            city = self.cities[owner]
+            if owner not in seen and (country is None or city.country == country):
+                seen.add(owner)
+                found.append(city)
+        found.sort(key=lambda c: -c.population)
+        return found[:limit] if limit else found
+
+    def _key_range(self, key, prefix=False):
+        start = bisect.bisect_left(self._keys, key)
+        end = start
+        while end < len(self._keys) and (self._keys[end].startswith(key) if prefix else self._keys[end] == key):
+            end += 1
+            if prefix and end - start >= PREFIX_SCAN:
+                break
+        return range(start, end)
+
+    def resolve(self, query):
+        """The City a query names exactly (any spelling we know, optionally ", country"), or None.
+        Several cities share a name: the most populous one wins."""
+        key, country = self._split_country(query)
+        if not key:
+            return None
+        found = self._ranked(self._key_range(key), country, 1)
+        return found[0] if found else None
+
+    def complete(self, prefix, limit=8):
+        """Cities with a name starting with prefix, most populous first."""
+        key, country = self._split_country(prefix)
+        if not key:
+            return []
+        return self._ranked(self._key_range(key, prefix=True), country, limit)
+
+    def near(self, query, limit=5):
+        """Cities whose name is within a typo or two of query, closest first."""
+        key, country = self._split_country(query)
+        if len(key) < 3:
+            return []
+        shared = Counter()
+        for gram in trigrams(key):
+            shared.update(self._trigrams.get(gram, ()))
+        allowed = max_typos(key)
+        scored = []
+        for position, _ in shared.most_common(FUZZY_CANDIDATES):
+            distance = edit_distance(key, self._keys[position], allowed)
+            if distance <= allowed:
+                scored.append((distance, position))
+        scored.sort()
+        seen, found = set(), []
+        for _, position in scored:
+            city = self.cities[self._owners[position]]
+            if city.id not in seen and (country is None or city.country == country):
+                seen.add(city.id)
+                found.append(city)
+        return found[:limit]
+
+    def suggest(self, query, limit=5):
+        """Completions followed by near misses, without duplicates."""
+        found, seen = [], set()
+        for city in self.complete(query, limit) + self.near(query, limit):
+            if city.id not in seen:
+                seen.add(city.id)
+                found.append(city)
+        return found[:limit]
+
+    def popular(self, limit):
+        """The limit most populous cities."""
+        return sorted(self.cities, key=lambda c: -c.population)[:limit]
+
+    def is_country(self, query):
+        """True for one of REJECTED_COUNTRIES that isn't also a city ("India" yes, "Kuwait" no)."""
+        return fold(query) in REJECTED_COUNTRIES and self.resolve(query) is None
+
+    def query_for(self, city):
+        """What to send OpenWeather for city: its name, plus the country when the name alone means another city."""
+        if self.resolve(city.name) is city:
+            return city.name
+        return f"{city.name},{city.country}"
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """The process-wide Gazetteer: GAZETTEER_FILE if set and readable, else the bundled seed."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                gazetteer = Gazetteer()
+                gazetteer.load_countries(COUNTRIES_FILE)
+                try:
+                    gazetteer.load_file(GAZETTEER_FILE or SEED_FILE)
+                except OSError:
+                    gazetteer.load_file(SEED_FILE)
+                _gazetteer = gazetteer.build()
+    return _gazetteer
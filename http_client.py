@@ -0,0 +1,211 @@
+"""Shared outbound HTTP client.
+
+One keep-alive requests.Session per process with a connection pool per host,
+bounded retries with jittered exponential backoff, a circuit breaker per host
+and per-endpoint timeouts. Use get_client() instead of bare requests.get.
+"""
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# (connect, read) timeouts in seconds, per logical endpoint
+ENDPOINT_TIMEOUTS = {
+    "current": (3.05, 6),
+    "forecast": (3.05, 8),
+    "onecall": (3.05, 8),
+    "air_pollution": (3.05, 5),
+    "geocoding": (3.05, 5),
+    "unsplash": (3.05, 6),
+    "tiles": (3.05, 10),
+}
+DEFAULT_TIMEOUT = (3.05, 8)
+
+POOL_HOSTS = 8  # host pools kept alive at once
+POOL_SIZE = 16  # connections per host; matches the fetch pool in new.py
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 2.0
+RETRY_STATUSES = {500, 502, 503, 504}
+
+BREAKER_THRESHOLD = 5  # consecutive failures before a host is cut off
+BREAKER_RESET = 30  # seconds before a single trial request is let through
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without touching the network while a host's breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """True if a request may go out now. In half-open state only one trial is allowed."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_after or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                # a failed trial re-opens the breaker for another full period
+                self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+class HttpClient:
+    def __init__(self, pool_size=POOL_SIZE, max_retries=MAX_RETRIES):
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        # urllib3 keeps a separate pool per host; retries are handled below so they can use the breaker
+        adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = "WeatherNow/1.0 (+streamlit)"
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker()
+            return self._breakers[host]
+
+    def get(self, url, params=None, endpoint=None, timeout=None, headers=None):
+        """GET with retries. Returns the final Response (any status) or raises.
+        headers are added to (or override) the session's."""
+        timeout = timeout or ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        breaker = self.breaker(urlsplit(url).netloc)
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                metrics.record_upstream(endpoint, "circuit_open", 0, 0.0)
+                raise CircuitOpenError(f"circuit open for {urlsplit(url).netloc}")
+            last_attempt = attempt == self.max_retries
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                status = "timeout" if isinstance(e, requests.exceptions.Timeout) else "error"
+                metrics.record_upstream(endpoint, status, 0, time.perf_counter() - start)
+                breaker.record_failure()
+                if last_attempt:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+            metrics.record_upstream(endpoint, response.status_code, len(response.content), time.perf_counter() - start)
+            if response.status_code in RETRY_STATUSES:
+                breaker.record_failure()
+                if not last_attempt:
+                    response.close()
+                    time.sleep(backoff_delay(attempt))
+                    continue
+            else:
+                breaker.record_success()
+            return response
+
+    def breaker_states(self):
+        """{host: breaker state}, reported by /healthz."""
+        with self._lock:
+            return {host: b.state for host, b in self._breakers.items()}
+
+
+class RequestBudget:
+    """Sliding-window cap on calls to a quota-limited API, shared by the whole process.
+
+    note_remaining() feeds back the provider's own remaining-quota header, so we
+    also stop early if other deployments are spending the same key.
+    """
+
+    def __init__(self, limit, window, reserve=2):
+        self.limit = limit
+        self.window = window
+        self.reserve = reserve
+        self._calls = deque()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._calls and now - self._calls[0] >= self.window:
+                self._calls.popleft()
+            if now < self._blocked_until or len(self._calls) >= self.limit:
+                return False
+            self._calls.append(now)
+            return True
+
+    def note_remaining(self, remaining):
+        try:
+            remaining = int(remaining)
+        except (TypeError, ValueError):
+            return
+        if remaining <= self.reserve:
+            with self._lock:
+                self._blocked_until = time.monotonic() + self.window
+
+    def remaining(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._blocked_until:
+                return 0
+            return max(0, self.limit - sum(1 for t in self._calls if now - t < self.window))
+
+
+_budgets = {}
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_budget(name, limit, window):
+    """Process-wide RequestBudget registered under name (limit/window apply on first call)."""
+    with _client_lock:
+        if name not in _budgets:
+            _budgets[name] = RequestBudget(limit, window)
+        return _budgets[name]
+
+
+def get_client():
+    """The process-wide HttpClient, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
@@ -0,0 +1,255 @@
+"""In-process metrics: counters, gauges and latency histograms, exported as Prometheus text.
+
+Everything is aggregated per process (like weather_cache). Hot-path cost is a
+dict lookup and a short lock. A Trace additionally collects the individual
+events of one Streamlit rerun for the sidebar timing panel. It is bound per
+thread (and per asyncio task) and carried into worker threads by bind().
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HELP = {
+    "weather_upstream_requests_total": "Outbound HTTP requests by endpoint and status.",
+    "weather_upstream_bytes_total": "Response body bytes received by endpoint.",
+    "weather_upstream_seconds": "Outbound request latency (one attempt) by endpoint.",
+    "weather_cache_lookups_total": "Cache lookups by endpoint and result (memory, store, miss, stale).",
+    "weather_store_write_seconds": "Time to write one entry to the SQLite offline store.",
+    "weather_render_stage_seconds": "Time spent in each render stage of the results page.",
+    "weather_quota_events_total": "OpenWeather quota scheduler events (queued, rejected, coalesced, ...).",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._counters = {}  # name -> {label_key: value}
+        self._histograms = {}  # name -> {label_key: Histogram}
+        self._gauges = {}  # name -> callable returning the current value
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    def register_gauge(self, name, fn, help_text=""):
+        """A value read by calling fn() at export time."""
+        with self._lock:
+            self._gauges[name] = fn
+        if help_text:
+            HELP[name] = help_text
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            gauges = dict(self._gauges)
+        for name in sorted(gauges):
+            try:
+                value = float(gauges[name]())
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets, hist.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {hist.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist.total:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+
+REGISTRY = Registry()
+
+
+# ---- per-rerun traces ----
+class Trace:
+    """Events of one page run: (kind, name, seconds, detail). Safe to append from workers."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, kind, name, seconds, detail=""):
+        with self._lock:
+            self.events.append((kind, name, seconds, detail))
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.events)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+# a ContextVar rather than a thread-local: each thread starts with its own value,
+# and each asyncio task gets a copy, so coroutines sharing one loop thread keep theirs apart
+_trace = ContextVar("weather_trace", default=None)
+
+
+def set_trace(trace):
+    _trace.set(trace)
+
+
+def current_trace():
+    return _trace.get()
+
+
+def bind(fn, trace=None):
+    """Wrap fn so it runs with the caller's trace (or the given one) in a worker thread."""
+    trace = trace or current_trace()
+    if trace is None:
+        return fn
+
+    def run(*args, **kwargs):
+        previous = current_trace()
+        set_trace(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            set_trace(previous)
+    return run
+
+
+def _trace_add(kind, name, seconds, detail=""):
+    trace = current_trace()
+    if trace is not None:
+        trace.add(kind, name, seconds, detail)
+
+
+# ---- recording helpers used on the hot paths ----
+def record_upstream(endpoint, status, nbytes, seconds):
+    endpoint = endpoint or "other"
+    REGISTRY.inc("weather_upstream_requests_total", endpoint=endpoint, status=status)
+    if nbytes:
+        REGISTRY.inc("weather_upstream_bytes_total", nbytes, endpoint=endpoint)
+    REGISTRY.observe("weather_upstream_seconds", seconds, endpoint=endpoint)
+    _trace_add("upstream", endpoint, seconds, f"{status}, {nbytes} B")
+
+
+def record_cache(endpoint, result):
+    REGISTRY.inc("weather_cache_lookups_total", endpoint=endpoint, result=result)
+    if result != "miss":
+        _trace_add("cache", endpoint, 0.0, result)
+
+
+@contextmanager
+def timed(metric, kind, name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        REGISTRY.observe(metric, seconds, **labels)
+        _trace_add(kind, name, seconds)
+
+
+def stage(name):
+    """with stage("forecast"): ... -- times one render stage."""
+    return timed("weather_render_stage_seconds", "stage", name, stage=name)
+
+
+def store_write():
+    return timed("weather_store_write_seconds", "store", "write")
+
+
+def register_gauge(name, fn, help_text=""):
+    REGISTRY.register_gauge(name, fn, help_text)
+
+
+def render():
+    return REGISTRY.render()
+
+
+# ---- standalone exporter (for the Streamlit process) ----
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """Serve GET /metrics on its own daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
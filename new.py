@@ -1,12 +1,23 @@
 import streamlit as st
-import requests
 from datetime import datetime, timedelta
-import base64
+import hashlib
+import html
+import io
 import os
 import json
-import folium
-from streamlit_folium import st_folium
-import matplotlib.pyplot as plt
+from concurrent.futures import as_completed, TimeoutError as FuturesTimeout
+import async_fetch
+import metrics
+import tile_proxy
+import weather_service
+from weather_service import (
+    CityNotFoundError, RateLimitedError, AQI_KEYS, peek_current, stale_current, load_cached_city,
+    remember_coords, seed_image_index, clothing_suggestion, uv_level,
+    is_country_name, resolve_city, get_prefetcher,
+)
+from gazetteer import get_gazetteer
+# folium and matplotlib are imported where a map or chart is drawn:
+# together they cost over a second of import time that the welcome page never needs
 
 # ====================================================================
 # CONFIGURATION AND TRANSLATIONS (Updated with new features)
@@ -15,12 +26,12 @@ import matplotlib.pyplot as plt
 # 🔑 API KEYS - USING PLACEHOLDERS HERE, ASSUMING USER HAS VALID KEYS
 API_KEY = st.secrets["OPENWEATHER_API_KEY"]
 UNSPLASH_ACCESS_KEY = st.secrets["UNSPLASH_ACCESS_KEY"]
-UNSPLASH_API_URL = "https://api.unsplash.com/search/photos"
+# all fetching, caching and transforms live in weather_service; it only needs the keys
+weather_service.configure(api_key=API_KEY, unsplash_key=UNSPLASH_ACCESS_KEY)
 
 
 # Persistence files
 FAV_FILE = os.path.join(os.getcwd(), "favourites.json")
-CACHE_FILE = os.path.join(os.getcwd(), "cache.json")
 
 # --- Dynamic Background Image URLs ---
 BACKGROUND_IMAGES = {
@@ -50,9 +61,10 @@ TRANSLATIONS = {
         "wind_speed": "Wind Speed",
         "pressure": "Pressure",
         "severe_alert": "🚨 Severe Weather Alert! Take precautions.",
-        "forecast_header": "📅 5-Day Forecast (Midday)",
+        "forecast_header": "📅 5-Day Forecast (Daily High / Low)",
         "hourly_header": "⏱ Next 24 Hours (Hourly Forecast)",
         "forecast_error": "Error: Could not fetch 5-day forecast. Check API configuration.",
+        "partial_day": "partial day",
         "city_not_found": "City '{}' not found! Please try again.",
         "error_fetching": "Error fetching weather data: {}",
         "theme_selector": "Interface Theme",
@@ -68,6 +80,7 @@ TRANSLATIONS = {
         "aqi_poor": "Poor (4)",
         "aqi_very_poor": "Very Poor (5)",
         "country_error": "Please enter a specific *city name*, not a country name.",
+        "did_you_mean": "Did you mean:",
         "favourites_header": "⭐ Favourite Locations",
         "no_favourites": "No favourites added yet.",
         "add_to_fav": "💖 Add to Favourites",
@@ -76,8 +89,17 @@ TRANSLATIONS = {
         "fav_removed": "{} removed from favourites!",
 #        "detect_location": "🧭 Detect My Location",
         "show_map_favourites": "Show Favourites on Map",
+        "dashboard_toggle": "📊 Favourites Dashboard",
+        "dashboard_header": "📊 Favourites at a Glance",
+        "cached_label": "cached",
         "about_header": "ℹ️ About This Project",
         "offline_notice": "Offline data used (cached).",
+        "data_age": "Showing data from {} min ago.",
+        "refreshing": "Refreshing in the background…",
+        "debug_timings": "⏱ Show timing panel (debug)",
+        "rate_limited": "Too many requests to the weather service right now. Please try again in about {} seconds.",
+        "rate_limited_cached": "The weather service is rate-limiting requests; showing the last saved data.",
+        "timings_header": "⏱ This run",
         "uv_low": "Low — minimal protection required.",
         "uv_moderate": "Moderate — wear sunglasses and SPF 30+.",
         "uv_high": "High — wear SPF 30+, hat, and avoid mid-day sun.",
@@ -99,9 +121,10 @@ TRANSLATIONS = {
         "wind_speed": "हवा की गति",
         "pressure": "दबाव",
         "severe_alert": "🚨 गंभीर मौसम चेतावनी! सावधानी बरतें।",
-        "forecast_header": "📅 5-दिन का पूर्वानुमान (दोपहर)",
+        "forecast_header": "📅 5-दिन का पूर्वानुमान (दैनिक अधिकतम / न्यूनतम)",
         "hourly_header": "⏱ अगले 24 घंटे (प्रति घंटा पूर्वानुमान)",
         "forecast_error": "त्रुटि: 5-दिन का पूर्वानुमान प्राप्त नहीं किया जा सका। एपीआई कॉन्फ़िगरेशन की जाँच करें।",
+        "partial_day": "आंशिक दिन",
         "city_not_found": "शहर '{}' नहीं मिला! कृपया पुनः प्रयास करें।",
         "error_fetching": "मौसम डेटा प्राप्त करने में त्रुटि: {}",
         "theme_selector": "इंटरफ़ेस थीम",
@@ -117,6 +140,7 @@ TRANSLATIONS = {
         "aqi_poor": "खराब (4)",
         "aqi_very_poor": "बहुत खराब (5)",
         "country_error": "कृपया किसी देश का नाम नहीं, बल्कि एक विशिष्ट *शहर का नाम* दर्ज करें।",
+        "did_you_mean": "क्या आपका मतलब था:",
         "favourites_header": "⭐ पसंदीदा स्थान",
         "no_favourites": "कोई पसंदीदा स्थान जोड़ा नहीं गया।",
         "add_to_fav": "💖 पसंदीदा में जोड़ें",
@@ -125,8 +149,17 @@ TRANSLATIONS = {
         "fav_removed": "{} पसंदीदा से हटाया गया!",
 #        "detect_location": "🧭 मेरा स्थान पता करें",
         "show_map_favourites": "नक्शे पर पसंदीदा दिखाएँ",
+        "dashboard_toggle": "📊 पसंदीदा डैशबोर्ड",
+        "dashboard_header": "📊 पसंदीदा एक नज़र में",
+        "cached_label": "कैश",
         "about_header": "ℹ️ इस परियोजना के बारे में",
         "offline_notice": "ऑफ़लाइन डेटा (कैश) का उपयोग किया गया।",
+        "data_age": "{} मिनट पहले का डेटा दिखाया जा रहा है।",
+        "refreshing": "पृष्ठभूमि में ताज़ा किया जा रहा है…",
+        "debug_timings": "⏱ टाइमिंग पैनल दिखाएँ (डीबग)",
+        "rate_limited": "अभी मौसम सेवा पर बहुत अधिक अनुरोध हैं। कृपया लगभग {} सेकंड बाद पुनः प्रयास करें।",
+        "rate_limited_cached": "मौसम सेवा अनुरोध सीमित कर रही है; अंतिम सहेजा गया डेटा दिखाया जा रहा है।",
+        "timings_header": "⏱ इस रन का समय",
         "uv_low": "कम — न्यूनतम सुरक्षा आवश्यक।",
         "uv_moderate": "मध्यम — धूप का चश्मा और SPF 30+ लगाएँ।",
         "uv_high": "उच्च — SPF 30+, टोपी पहनें, मध्य-दिवस के सूरज से बचें।",
@@ -146,32 +179,34 @@ if 'current_weather_data' not in st.session_state:
     st.session_state['current_weather_data'] = None
 if 'aqi_data' not in st.session_state:
     st.session_state['aqi_data'] = None
+if 'data_age' not in st.session_state:
+    st.session_state['data_age'] = None  # seconds, when current_weather_data is a stale copy
+if 'revalidating' not in st.session_state:
+    st.session_state['revalidating'] = None  # (city, future) of a background refresh
+if 'city_suggestions' not in st.session_state:
+    st.session_state['city_suggestions'] = []  # gazetteer labels offered after a near miss
+if 'sections' not in st.session_state:
+    st.session_state['sections'] = None  # ((city, lat, lon), {section: result}) already fetched
 
 # load favourites from file (persistent across restarts)
+# entries are {"name", "lat", "lon"}; plain name strings from older files are still accepted
 if 'favourites' not in st.session_state:
+    st.session_state['favourites'] = []
+    st.session_state['favourite_coords'] = {}
     try:
         if os.path.exists(FAV_FILE):
             with open(FAV_FILE, 'r', encoding='utf-8') as f:
-                st.session_state['favourites'] = json.load(f)
-                if not isinstance(st.session_state['favourites'], list):
-                    st.session_state['favourites'] = []
-        else:
-            st.session_state['favourites'] = []
+                saved = json.load(f)
+            for entry in saved if isinstance(saved, list) else []:
+                if isinstance(entry, str):
+                    st.session_state['favourites'].append(entry)
+                elif isinstance(entry, dict) and entry.get('name'):
+                    st.session_state['favourites'].append(entry['name'])
+                    if entry.get('lat') is not None and entry.get('lon') is not None:
+                        st.session_state['favourite_coords'][entry['name']] = [entry['lat'], entry['lon']]
     except Exception:
         st.session_state['favourites'] = []
-
-# load cache dictionary
-if 'cache' not in st.session_state:
-    try:
-        if os.path.exists(CACHE_FILE):
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                st.session_state['cache'] = json.load(f)
-                if not isinstance(st.session_state['cache'], dict):
-                    st.session_state['cache'] = {}
-        else:
-            st.session_state['cache'] = {}
-    except Exception:
-        st.session_state['cache'] = {}
+        st.session_state['favourite_coords'] = {}
 
 # --- UTILITY FUNCTIONS ---
 def get_translation(key):
@@ -180,15 +215,96 @@ def get_translation(key):
 
 def set_search_triggered():
     st.session_state['search_triggered'] = True
-
-def get_base64_image(image_path):
+    # show the gazetteer's spelling ("bombay" -> "Mumbai") before the box is drawn again
+    city = get_gazetteer().resolve(st.session_state.get('city_input') or "")
+    if city is not None:
+        st.session_state['city_input'] = get_gazetteer().query_for(city)
+
+# ---- CITY SEARCH BOX (type-ahead over the gazetteer; any other name can still be entered) ----
+AUTOCOMPLETE_OPTIONS = 1000  # most populous gazetteer cities offered while typing
+
+@st.cache_resource
+def autocomplete_cities():
+    """{search query: "Name, CC" label} for the cities the search box offers."""
+    gazetteer = get_gazetteer()
+    return {gazetteer.query_for(c): c.label for c in gazetteer.popular(AUTOCOMPLETE_OPTIONS)}
+
+def city_options():
+    """Gazetteer cities plus favourites and the current value, which must stay selectable."""
+    options = list(autocomplete_cities())
+    known = set(options)
+    for name in st.session_state.get('favourites', []) + [st.session_state.get('city_input')]:
+        if name and name not in known:
+            known.add(name)
+            options.append(name)
+    return options
+
+def city_option_label(query):
+    return autocomplete_cities().get(query, query)
+
+def pick_suggestion():
+    city = get_gazetteer().resolve(st.session_state.get('city_pick') or "")
+    if city is not None:
+        st.session_state['city_input'] = get_gazetteer().query_for(city)
+        st.session_state['city_suggestions'] = []
+        st.session_state['search_triggered'] = True
+
+# ---- Background image assets (served by Streamlit static serving, see .streamlit/config.toml) ----
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "app/static"
+BG_WIDTHS = (1280, 1920, 2560)  # one variant per viewport class; smallest is the default
+
+@st.cache_resource
+def prepare_background_assets(image_path):
+    """Runs once per process. Returns [(min_viewport_width, url)] ascending, or [] if no image.
+
+    With Pillow installed the image is resized to each of BG_WIDTHS and written as WebP;
+    otherwise the original file is published unchanged. Names carry a content hash so
+    browsers can cache them indefinitely.
+    """
     try:
         if not os.path.exists(image_path):
-            return None
+            return []
         with open(image_path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode()
+            raw = img_file.read()
+        digest = hashlib.sha1(raw).hexdigest()[:10]
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        try:
+            from PIL import Image
+        except ImportError:
+            Image = None
+        if Image is None:
+            name = f"{stem}-{digest}{os.path.splitext(image_path)[1]}"
+            target = os.path.join(STATIC_DIR, name)
+            if not os.path.exists(target):
+                with open(target, "wb") as out:
+                    out.write(raw)
+            return [(0, f"{STATIC_URL}/{name}")]
+        assets = []
+        with Image.open(io.BytesIO(raw)) as img:
+            img = img.convert("RGB")
+            min_width = 0
+            for width in BG_WIDTHS:
+                w = min(width, img.width)
+                name = f"{stem}-{digest}-{w}.webp"
+                target = os.path.join(STATIC_DIR, name)
+                if not os.path.exists(target):
+                    img.resize((w, round(img.height * w / img.width))).save(target, "WEBP", quality=80)
+                assets.append((min_width, f"{STATIC_URL}/{name}"))
+                min_width = width + 1
+                if w == img.width:
+                    break  # no point upscaling
+        return assets
     except Exception:
-        return None
+        return []
+
+def background_media_css(assets):
+    """Swap in larger variants on wider viewports."""
+    rules = []
+    for min_width, url in assets[1:]:
+        rules.append(f"@media (min-width: {min_width}px) {{ .stApp::before {{ background-image: url('{url}') !important; }} }}")
+    return "\n    ".join(rules)
 
 def get_weather_background_url(main_condition):
     condition = main_condition.lower()
@@ -196,28 +312,6 @@ def get_weather_background_url(main_condition):
         return BACKGROUND_IMAGES.get("mist", None)
     return BACKGROUND_IMAGES.get(condition, None)
 
-def fetch_unsplash_image_url(city_name):
-    KNOWN_CITIES = {
-        "amritsar": "https://images.pexels.com/photos/17798305/pexels-photo-17798305/free-photo-of-golden-temple-at-night.jpeg?auto=compress&cs=tinysrgb&w=800",
-        "delhi": "https://images.pexels.com/photos/3476472/pexels-photo-3476472.jpeg?auto=compress&cs=tinysrgb&w=800",
-        "mumbai": "https://images.pexels.com/photos/10203531/pexels-photo-10203531.jpeg?auto=compress&cs=tinysrgb&w=800",
-        "london": "https://images.pexels.com/photos/460672/pexels-photo-460672.jpeg?auto=compress&cs=tinysrgb&w=800",
-    }
-    if not UNSPLASH_ACCESS_KEY:
-        return KNOWN_CITIES.get(city_name.lower(), None)
-    try:
-        query = f"famous landmark in {city_name}"
-        params = {"query": query, "per_page": 1, "client_id": UNSPLASH_ACCESS_KEY}
-        response = requests.get(UNSPLASH_API_URL, params=params, timeout=8)
-        response.raise_for_status()
-        data = response.json()
-        if data.get('results'):
-            return data['results'][0]['urls']['regular']
-        else:
-            return KNOWN_CITIES.get(city_name.lower(), None)
-    except Exception:
-        return KNOWN_CITIES.get(city_name.lower(), None)
-
 def update_theme(theme_choice):
     st.session_state['theme'] = 'dark' if 'Dark' in theme_choice or 'गहरा' in theme_choice else 'light'
 
@@ -235,51 +329,40 @@ def get_temp_based_accent_color(temp, is_dark):
 
 # ---- Favourites persistence helpers ----
 def save_favourites_to_file():
+    coords = st.session_state.get('favourite_coords', {})
+    entries = []
+    for name in st.session_state.get('favourites', []):
+        lat, lon = coords.get(name, (None, None))
+        entries.append({"name": name, "lat": lat, "lon": lon})
     try:
         with open(FAV_FILE, "w", encoding='utf-8') as f:
-            json.dump(st.session_state.get('favourites', []), f, ensure_ascii=False, indent=2)
+            json.dump(entries, f, ensure_ascii=False, indent=2)
     except Exception:
         pass
 
-def add_to_favourites(city_name):
+def add_to_favourites(city_name, lat=None, lon=None):
     city_title = city_name.title()
     if city_title not in st.session_state['favourites']:
         st.session_state['favourites'].append(city_title)
+        if lat is not None and lon is not None:
+            # we already know where it is; no geocoding needed later
+            st.session_state.setdefault('favourite_coords', {})[city_title] = [lat, lon]
+            remember_coords(city_title, lat, lon)
         save_favourites_to_file()
         st.success(get_translation('fav_added').format(city_title))
     else:
         st.info(f"⭐ {city_title} is already in your favourites!")
 
-def remove_from_favourites(city_name):
+def remove_from_favourites(city_name, announce=True):
     city_title = city_name.title()
     if city_title in st.session_state['favourites']:
         st.session_state['favourites'].remove(city_title)
+        st.session_state.get('favourite_coords', {}).pop(city_title, None)
         save_favourites_to_file()
-        st.success(get_translation('fav_removed').format(city_title))
-
-# ---- Cache helpers (offline mode) ----
-def save_cache():
-    try:
-        with open(CACHE_FILE, "w", encoding='utf-8') as f:
-            json.dump(st.session_state.get('cache', {}), f, ensure_ascii=False, indent=2)
-    except Exception:
-        pass
-
-def cache_city_data(city, data):
-    if not city or not data:
-        return
-    st.session_state.setdefault('cache', {})
-    st.session_state['cache'][city.title()] = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "data": data
-    }
-    save_cache()
-
-def load_cached_city(city):
-    c = st.session_state.get('cache', {}).get(city.title())
-    if c:
-        return c.get('data')
-    return None
+        if announce:
+            st.success(get_translation('fav_removed').format(city_title))
+        else:
+            st.session_state['fav_removed'] = city_title
 
 # ---- PAGE CONFIG ----
 st.set_page_config(page_title="Weather Now", page_icon="☁", layout="wide")
@@ -291,7 +374,7 @@ def get_global_accent_color():
 accent_color = get_global_accent_color()
 
 # ---- DYNAMIC CSS (keeps original appearance) ----
-def apply_dynamic_css(dynamic_bg_style, accent_color):
+def apply_dynamic_css(dynamic_bg_style, accent_color, bg_media_css=""):
     is_dark = st.session_state.theme == 'dark'
     bg_color_main = "#1e1e1e" if is_dark else "#333333"
     text_color = "#f0f2f6" if is_dark else "#333333"
@@ -318,6 +401,7 @@ def apply_dynamic_css(dynamic_bg_style, accent_color):
         z-index: -1; 
         filter: brightness({0.9 if is_dark else 1.0});
     }}
+    {bg_media_css}
     .stText, .stMarkdown, .stSubheader, .stTitle, h1, h2, h3, h4, p, label {{
         color: {text_color} !important;
     }}
@@ -326,6 +410,8 @@ def apply_dynamic_css(dynamic_bg_style, accent_color):
         border-radius: 20px; padding: 20px; margin-bottom: 15px;
         box-shadow: 0 8px 32px 0 rgba(0,0,0,0.15); border:1px solid {border_color};
     }}
+    .forecast-row {{ display:grid; grid-template-columns:repeat(auto-fit, minmax(110px, 1fr)); gap:1rem; margin-bottom:15px; }}
+    .forecast-row .forecast-card {{ margin-bottom:0; text-align:center; }}
     .city-image {{ width:100%; max-height:350px; height:100%; border-radius:20px; object-fit:cover; }}
     div[data-testid="stMetric"] > div {{ background: {metric_bg}; border-radius: 15px; padding: 8px 10px; }}
     .main-weather-card h1 {{ font-size: 5rem; color: {text_color}; margin-bottom:-15px !important; margin-top:0px !important; }}
@@ -377,219 +463,304 @@ def apply_dynamic_css(dynamic_bg_style, accent_color):
 #     return {"city": None, "country": None, "lat": None, "lon": None}
 
 # ---- WEATHER FETCHING FUNCTIONS ----
-def fetch_weather_basic(city):
-    """Fetch current weather (same as before). Returns JSON or None. Uses cache if offline."""
-    try:
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={API_KEY}&units=metric"
-        res = requests.get(url, timeout=8).json()
-        if res.get("cod") != 200:
-            return None
-        # cache
-        cache_city_data(city, res)
-        return res
-    except Exception:
-        # try cache
-        cached = load_cached_city(city)
-        if cached:
-            st.warning(get_translation("offline_notice"))
-            return cached
-        return None
-
-def fetch_onecall(lat, lon):
-    """Fetch One Call data (daily, current) for UV, 7-day, etc."""
-    try:
-        url = f"https://api.openweathermap.org/data/2.5/onecall?lat={lat}&lon={lon}&exclude=minutely,hourly,alerts&appid={API_KEY}&units=metric"
-        res = requests.get(url, timeout=8).json()
-        if res:
-            # optionally cache using latlon key
-            key = f"{lat:.4f},{lon:.4f}"
-            st.session_state.setdefault('cache', {})
-            st.session_state['cache'][key] = {"timestamp": datetime.utcnow().isoformat(), "data": res}
-            save_cache()
-            return res
-    except Exception:
-        # try cached onecall by latlon key
-        key = f"{lat:.4f},{lon:.4f}"
-        cached = st.session_state.get('cache', {}).get(key)
-        if cached:
-            st.warning(get_translation("offline_notice"))
-            return cached.get('data')
-    return None
-
-def fetch_aqi(lat, lon):
-    try:
-        aqi_url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={API_KEY}"
-        aqi_res = requests.get(aqi_url, timeout=8).json()
-        if aqi_res.get("list"):
-            aqi_val = aqi_res["list"][0]["main"]["aqi"]
-            key_map = {1: 'aqi_good', 2: 'aqi_fair', 3: 'aqi_moderate', 4: 'aqi_poor', 5: 'aqi_very_poor'}
-            aqi_description_key = key_map.get(aqi_val)
-            return get_translation(aqi_description_key)
-    except Exception:
-        return None
+# Fetching and caching live in weather_service; fetch_weather_and_data() below adds the UI messages.
+def aqi_label(aqi_val):
+    key = AQI_KEYS.get(aqi_val)
+    return get_translation(key) if key else None
 
-# ---- Clothing suggestion & UV advice ----
-def clothing_suggestion(temp_c, humidity, wind_speed):
-    tips = []
-    try:
-        t = float(temp_c)
-    except Exception:
-        return "No suggestion available."
-
-    if t <= 5:
-        tips.append("Heavy winter jacket, gloves, warm hat.")
-    elif t <= 15:
-        tips.append("Jacket or sweater; layers recommended.")
-    elif t <= 25:
-        tips.append("Light jacket or long sleeves.")
-    else:
-        tips.append("T-shirt / light clothing; stay hydrated.")
+# ---- UV advice ----
+def uv_advice(uvi):
+    key = uv_level(uvi)
+    return get_translation(key) if key else ""
+
+# ---- GEOCODING ----
+GEOCODE_DEADLINE = 8  # seconds for resolving all missing favourites
+
+def favourite_coordinates():
+    """[(name, lat, lon)] for every favourite. Only favourites without stored coords are geocoded, in parallel."""
+    favourites = st.session_state.get('favourites', [])
+    coords = st.session_state.setdefault('favourite_coords', {})
+    missing = [name for name in favourites if name not in coords]
+    if missing:
+        futures = {submit_fetch(async_fetch.geocode_city(name)): name for name in missing}
+        resolved = False
+        for name, result in iter_completed_fetches(futures, deadline=GEOCODE_DEADLINE):
+            if result:
+                coords[name] = list(result)
+                resolved = True
+        if resolved:
+            save_favourites_to_file()
+    return [(name, coords[name][0], coords[name][1]) for name in favourites if name in coords]
 
-    # humidity/wind modifiers
-    try:
-        h = float(humidity)
-        w = float(wind_speed)
-        if h >= 80 and t >= 20:
-            tips.append("High humidity — breathable fabrics recommended.")
-        if w >= 10 and t <= 15:
-            tips.append("Windy — consider a windbreaker.")
-    except Exception:
-        pass
+# ---- MAP VIEW (folium) ----
+# The map is built once per (center, zoom, favourites, theme) and kept as an HTML page; reruns that
+# don't change any of those send the same HTML again without touching folium.
+MAP_HTML_CACHE_SIZE = 64  # rendered maps kept per process
+MAP_ZOOM = 10
+MAP_HEIGHT = 450
+MAP_TILES = {"light": "OpenStreetMap", "dark": "CartoDB dark_matter"}
+# Tiles from a tile_proxy.py instead of the public servers. Browsers fetch the tiles, so MAP_TILE_URL
+# must be the address *they* reach the proxy at (https behind an https app), e.g.
+# https://weather.example.com/tiles/{z}/{x}/{y}.png. TILE_PROXY_PORT also runs the proxy in-process.
+MAP_TILE_URL = os.environ.get("MAP_TILE_URL", "")
+TILE_PROXY_PORT = os.environ.get("TILE_PROXY_PORT", "")
+TILE_ATTRIBUTION = '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+
+def favourites_geojson(favourites):
+    """[(name, lat, lon)] -> one GeoJSON FeatureCollection of points."""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "properties": {"name": name},
+             "geometry": {"type": "Point", "coordinates": [lon, lat]}}  # GeoJSON order is lon, lat
+            for name, lat, lon in favourites
+        ],
+    }
 
-    return " ".join(tips)
+@st.cache_data(max_entries=MAP_HTML_CACHE_SIZE, show_spinner=False)
+def map_html(lat, lon, zoom, city_name, favourites, theme):
+    """Standalone Leaflet page for the map. favourites is a sorted tuple of (name, lat, lon)
+    and is drawn as a single GeoJSON layer rather than one marker per favourite."""
+    import folium
 
-def uv_advice(uvi):
-    try:
-        u = float(uvi)
-    except Exception:
-        return ""
-    if u < 3:
-        return get_translation("uv_low")
-    elif u < 6:
-        return get_translation("uv_moderate")
-    elif u < 8:
-        return get_translation("uv_high")
-    elif u < 11:
-        return get_translation("uv_very_high")
+    if MAP_TILE_URL:
+        m = folium.Map(location=[lat, lon], zoom_start=zoom, tiles=MAP_TILE_URL, attr=TILE_ATTRIBUTION,
+                       max_zoom=tile_proxy.MAX_ZOOM)
     else:
-        return get_translation("uv_extreme")
+        m = folium.Map(location=[lat, lon], zoom_start=zoom, tiles=MAP_TILES.get(theme, MAP_TILES["light"]))
+    folium.Marker([lat, lon], popup=f"{city_name or 'Location'}").add_to(m)
+    if favourites:
+        folium.GeoJson(
+            favourites_geojson(favourites),
+            name="favourites",
+            marker=folium.CircleMarker(radius=6, color="red", fill=True),
+            popup=folium.GeoJsonPopup(fields=["name"], labels=False),
+            tooltip=folium.GeoJsonTooltip(fields=["name"], labels=False),
+        ).add_to(m)
+    return m.get_root().render()
 
-# ---- MAP VIEW (folium) ----
 def show_map(lat, lon, city_name=None, show_favourites=False):
-    m = folium.Map(location=[lat, lon], zoom_start=10, tiles="OpenStreetMap")
-    folium.Marker([lat, lon], popup=f"{city_name or 'Location'}").add_to(m)
+    favourites = ()
     if show_favourites and st.session_state.get('favourites'):
-        # try to geocode favourites using OpenWeather (simple approach)
-        for fav in st.session_state['favourites']:
-            try:
-                r = requests.get(f"http://api.openweathermap.org/geo/1.0/direct?q={fav}&limit=1&appid={API_KEY}", timeout=6).json()
-                if r:
-                    latf = r[0].get('lat'); lonf = r[0].get('lon')
-                    folium.CircleMarker(location=[latf, lonf], radius=6, color="red", fill=True, popup=fav).add_to(m)
-            except Exception:
-                continue
-    st_data = st_folium(m, width=700, height=450)
-    return st_data
+        favourites = tuple(sorted((name, float(la), float(lo)) for name, la, lo in favourite_coordinates()))
+    html_page = map_html(float(lat), float(lon), MAP_ZOOM, city_name, favourites, st.session_state.get('theme', 'light'))
+    st.iframe(html_page, height=MAP_HEIGHT)
+    server = start_tile_server()
+    if server is not None:
+        # warm the proxy for this city and every favourite with known coordinates
+        points = [(lat, lon)] + [tuple(c) for c in st.session_state.get('favourite_coords', {}).values()]
+        server.proxy.seed_in_background(points, (MAP_ZOOM,))
 
 # ---- HOURLY and 5-day render functions (kept similar) ----
-def render_hourly_forecast(city):
-    T = get_translation
-    text_color = "#f0f2f6" if st.session_state.theme == 'dark' else "#333333"
-    accent = accent_color
+FORECAST_ICONS = {
+    "clear": "☀", "clouds": "☁", "rain": "🌧", "thunderstorm": "⛈",
+    "snow": "❄", "drizzle": "☔", "mist": "🌫", "haze": "🌫",
+}
 
-    try:
-        forecast_url = f"http://api.openweathermap.org/data/2.5/forecast?q={city}&appid={API_KEY}&units=metric"
-        forecast_res = requests.get(forecast_url, timeout=8).json()
-    except Exception:
-        forecast_res = None
-
-    if forecast_res and forecast_res.get("cod") == "200":
-        hourly_data = forecast_res["list"][:8]  # next 8 entries
-        st.markdown(f"<h2 style='color: {accent}; margin-top: 20px;'>{T('hourly_header')}</h2>", unsafe_allow_html=True)
-        hourly_cols = st.columns(len(hourly_data))
-        for i, info in enumerate(hourly_data):
-            time_formatted = datetime.strptime(info["dt_txt"], "%Y-%m-%d %H:%M:%S").strftime("%I %p").lstrip('0')
-            condition = info["weather"][0]["main"].lower()
-            icon_map = {
-                "clear": "☀", "clouds": "☁", "rain": "🌧", "thunderstorm": "⛈",
-                "snow": "❄", "drizzle": "☔", "mist": "🌫", "haze": "🌫",
-            }
-            icon = icon_map.get(condition, "❓")
-            translated_condition = info["weather"][0]["description"].title()
-            with hourly_cols[i]:
-                st.markdown(
-                    f"""
-                    <div class="card forecast-card" style="padding: 10px; text-align: center; height: 100%;">
-                        <h4 style='margin-bottom: 0px; color: {accent};'>{time_formatted}</h4>
-                        <p style='font-size: 1.5rem; margin-top: 5px; margin-bottom: 5px;'>{icon}</p>
-                        <p style='font-size: 1.2rem; font-weight: bold; margin: 0; color: {text_color};'>{info["main"]["temp"]:.0f}°C</p>
-                        <p style='font-size: 0.7rem; opacity: 0.8; margin-top: 5px; color: {text_color}; white-space: normal;'>{translated_condition}</p>
-                    </div>
-                    """, unsafe_allow_html=True
-                )
+# One st.markdown per row: the cards are laid out by the .forecast-row CSS grid instead of
+# st.columns, and the HTML is built from these templates once per (forecast, theme, language)
+FORECAST_HTML_CACHE_SIZE = 256  # rendered rows kept per process
+MIN_DAY_STEPS = 3  # a day with fewer forecast steps has no meaningful high / low, so gets no card
+FORECAST_ROW = "<h2 style='color: {accent}; margin-top: 20px;'>{header}</h2><div class='forecast-row'>{cards}</div>".format
+HOURLY_CARD = (
+    "<div class='card forecast-card' style='padding: 10px;'>"
+    "<h4 style='margin-bottom: 0px; color: {accent};'>{time}</h4>"
+    "<p style='font-size: 1.5rem; margin-top: 5px; margin-bottom: 5px;'>{icon}</p>"
+    "<p style='font-size: 1.2rem; font-weight: bold; margin: 0; color: {text};'>{temp:.0f}°C</p>"
+    "<p style='font-size: 0.7rem; opacity: 0.8; margin-top: 5px; color: {text}; white-space: normal;'>{description}</p>"
+    "</div>"
+).format
+DAILY_CARD = (
+    "<div class='card forecast-card' style='padding: 15px;'>"
+    "<h4 style='margin-bottom: 0px; color: {accent};'>{day}</h4>"
+    "<p class='date-text'>{date}</p>"
+    "<p style='font-size: 2rem; margin-top: 0; margin-bottom: 10px;'>{icon}</p>"
+    "<p style='font-size: 1.5rem; font-weight: bold; margin: 0; color: {text};'>{high:.0f}° / {low:.0f}°C</p>"
+    "<p style='font-size: 0.8rem; opacity: 0.8; margin-top: 5px; color: {text};'>{description}{rain}</p>"
+    "</div>"
+).format
+
+def theme_text_color(theme):
+    return "#f0f2f6" if theme == 'dark' else "#333333"
+
+@st.cache_data(max_entries=FORECAST_HTML_CACHE_SIZE, show_spinner=False)
+def hourly_row_html(fingerprint, theme, language, accent, _forecast):
+    """Header plus the next 8 steps as one HTML block. _forecast is not hashed; fingerprint stands in for it."""
+    text = theme_text_color(theme)
+    steps = min(len(_forecast), 8)
+    local_dt = _forecast.local_dt()  # times shown in the city's own timezone
+    cards = "".join(
+        HOURLY_CARD(
+            accent=accent, text=text,
+            time=datetime.utcfromtimestamp(int(local_dt[i])).strftime("%I %p").lstrip('0'),
+            icon=FORECAST_ICONS.get(_forecast.condition[i], "❓"),
+            temp=_forecast.temp[i],
+            description=html.escape(_forecast.description[i]),
+        )
+        for i in range(steps)
+    )
+    return FORECAST_ROW(accent=accent, header=TRANSLATIONS[language]['hourly_header'], cards=cards)
+
+@st.cache_data(max_entries=FORECAST_HTML_CACHE_SIZE, show_spinner=False)
+def daily_row_html(fingerprint, theme, language, accent, _forecast):
+    """Header plus up to 5 local days (true highs/lows over all their 3-hour steps) as one HTML block.
+
+    Days with fewer than MIN_DAY_STEPS steps are left out; other partly covered days are labelled."""
+    text = theme_text_color(theme)
+    daily = _forecast.daily()
+    daily = daily.select(daily.steps >= MIN_DAY_STEPS)
+    partial = daily.partial()
+    cards = []
+    for i in range(min(len(daily), 5)):
+        day = datetime.utcfromtimestamp(int(daily.day[i]))
+        date = day.strftime("%b %d")
+        if partial[i]:
+            date += " · " + TRANSLATIONS[language]['partial_day']
+        cards.append(DAILY_CARD(
+            accent=accent, text=text,
+            day=day.strftime("%a"), date=date,
+            icon=FORECAST_ICONS.get(daily.condition[i], "❓"),
+            high=daily.temp_max[i], low=daily.temp_min[i],
+            description=html.escape(daily.description[i]),
+            rain=f" · 💧 {daily.precip[i]:.1f} mm" if daily.precip[i] >= 0.1 else "",
+        ))
+    return FORECAST_ROW(accent=accent, header=TRANSLATIONS[language]['forecast_header'], cards="".join(cards))
+
+def render_hourly_forecast(forecast):
+    if forecast and len(forecast):
+        st.markdown(hourly_row_html(forecast.fingerprint(), st.session_state.theme, st.session_state.language,
+                                    accent_color, forecast), unsafe_allow_html=True)
         st.markdown("---")
     else:
         st.warning(get_translation("forecast_error"))
 
-def render_5day_forecast(city):
-    T = get_translation
-    accent = accent_color
-    text = "#f0f2f6" if st.session_state.theme == 'dark' else "#333333"
-    try:
-        forecast_url = f"http://api.openweathermap.org/data/2.5/forecast?q={city}&appid={API_KEY}&units=metric"
-        forecast_res = requests.get(forecast_url, timeout=8).json()
-    except Exception:
-        forecast_res = None
-
-    st.markdown(f"<h2 style='color: {accent};'>{T('forecast_header')}</h2>", unsafe_allow_html=True)
-    if forecast_res and forecast_res.get("cod") == "200":
-        forecast_days = {}
-        for entry in forecast_res["list"]:
-            if "12:00:00" in entry["dt_txt"]:
-                date = entry["dt_txt"].split(" ")[0]
-                if len(forecast_days) < 5:
-                    forecast_days[date] = entry
-        forecast_cols = st.columns(min(len(forecast_days), 5))
-        for i, (date, info) in enumerate(list(forecast_days.items())[:5]):
-            date_formatted_day = datetime.strptime(date, "%Y-%m-%d").strftime("%a")
-            date_formatted_date = datetime.strptime(date, "%Y-%m-%d").strftime("%b %d")
-            condition = info["weather"][0]["main"].lower()
-            icon_map = {
-                "clear": "☀", "clouds": "☁", "rain": "🌧", "thunderstorm": "⛈",
-                "snow": "❄", "drizzle": "☔", "mist": "🌫", "haze": "🌫",
-            }
-            icon = icon_map.get(condition, "❓")
-            with forecast_cols[i]:
-                translated_condition = info["weather"][0]["description"].title()
-                st.markdown(
-                    f"""
-                    <div class="card forecast-card" style="padding: 15px; text-align: center;">
-                        <h4 style='margin-bottom: 0px; color: {accent};'>{date_formatted_day}</h4>
-                        <p class="date-text">{date_formatted_date}</p>
-                        <p style='font-size: 2rem; margin-top: 0; margin-bottom: 10px;'>{icon}</p>
-                        <p style='font-size: 1.5rem; font-weight: bold; margin: 0; color: {text};'>{info["main"]["temp"]:.0f}°C</p>
-                        <p style='font-size: 0.8rem; opacity: 0.8; margin-top: 5px; color: {text};'>{translated_condition}</p>
-                    </div>
-                    """, unsafe_allow_html=True
-                )
+def render_5day_forecast(forecast):
+    if forecast and len(forecast):
+        st.markdown(daily_row_html(forecast.fingerprint(), st.session_state.theme, st.session_state.language,
+                                   accent_color, forecast), unsafe_allow_html=True)
     else:
+        st.markdown(f"<h2 style='color: {accent_color};'>{get_translation('forecast_header')}</h2>", unsafe_allow_html=True)
         st.warning(get_translation("forecast_error"))
 
-# ---- Climate trend graph (7-day) using One Call daily data ----
+# ---- Climate trend graph (7-day) using One Call daily data, else the forecast's daily aggregates ----
+TREND_CHART_CACHE_SIZE = 128  # rendered PNGs kept per process
+
+@st.cache_data(max_entries=TREND_CHART_CACHE_SIZE, show_spinner=False)
+def trend_chart_png(city_title, dates, temps, theme, lows=None, highs=None):
+    """Render the trend chart to PNG bytes with the OO Figure API (no global pyplot state).
+
+    Memoized on (city, daily temps, theme), so reruns and other sessions reuse the bytes.
+    lows/highs, when given, are drawn as a band around the line.
+    """
+    from matplotlib.figure import Figure
+
+    is_dark = theme == 'dark'
+    fg = "#f0f2f6" if is_dark else "#333333"
+    bg = "#1e1e1e" if is_dark else "#ffffff"
+    fig = Figure(figsize=(9, 3), facecolor=bg)
+    ax = fig.subplots()
+    ax.set_facecolor(bg)
+    ax.plot(dates, temps, marker='o')
+    if lows and highs:
+        ax.fill_between(dates, lows, highs, alpha=0.2)
+    ax.set_title(f"{len(dates)}-day temperature trend — {city_title}", color=fg)
+    ax.set_xlabel("Day", color=fg)
+    ax.set_ylabel("Temp (°C)", color=fg)
+    ax.tick_params(colors=fg)
+    ax.grid(True)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=100, bbox_inches="tight", facecolor=bg)
+    return buf.getvalue()
+
 def render_7day_trend(onecall_data, city):
-    if not onecall_data or 'daily' not in onecall_data:
+    if not onecall_data or not len(onecall_data.dt):
+        return
+    dates = tuple(datetime.utcfromtimestamp(dt).strftime('%a %d') for dt in onecall_data.dt[:7])
+    temps = tuple(onecall_data.temp_day[:7])
+    png = trend_chart_png(city.title(), dates, temps, st.session_state.get('theme', 'light'))
+    st.image(png, width="stretch")
+
+def render_forecast_trend(forecast, city):
+    """Trend from the 5-day forecast (daily mean, min-max band) for when One Call has no data.
+    Only whole days are plotted: a partial day's mean is just its morning or evening."""
+    if not forecast or not len(forecast):
+        return
+    daily = forecast.daily()
+    daily = daily.select(~daily.partial())
+    if not len(daily):
         return
-    daily = onecall_data['daily'][:7]
-    dates = [datetime.utcfromtimestamp(d['dt']).strftime('%a %d') for d in daily]
-    temps = [d['temp']['day'] for d in daily]
-    plt.figure(figsize=(9,3))
-    plt.plot(dates, temps, marker='o')
-    plt.title(f"7-day temperature trend — {city.title()}")
-    plt.xlabel("Day")
-    plt.ylabel("Temp (°C)")
-    plt.grid(True)
-    st.pyplot(plt)
-    plt.clf()
+    dates = tuple(datetime.utcfromtimestamp(int(d)).strftime('%a %d') for d in daily.day)
+    png = trend_chart_png(
+        city.title(), dates, tuple(daily.temp_mean.round(1).tolist()), st.session_state.get('theme', 'light'),
+        lows=tuple(daily.temp_min.tolist()), highs=tuple(daily.temp_max.tolist()),
+    )
+    st.image(png, width="stretch")
+
+# ---- PARALLEL FETCH STAGE ----
+# Requests run as coroutines on async_fetch's shared event loop (one connection pool for every
+# session); the script thread only waits on the futures.
+FETCH_DEADLINE = 10  # seconds for the whole per-city fan-out
+
+def submit_fetch(coro):
+    """Start coro on the shared fetch loop with this rerun's trace. Returns a concurrent Future."""
+    return async_fetch.submit(coro)
+
+SECTIONS = ("image", "aqi", "onecall", "forecast")
+
+def start_city_fetches(city, lat, lon, names=SECTIONS):
+    """Start every independent per-city request at once. Returns {future: section name}."""
+    coros = async_fetch.section_coroutines(city, lat, lon, names)
+    return {submit_fetch(coro): name for name, coro in coros.items()}
+
+def section_ok(name, result):
+    if name == "onecall":
+        return bool(result) and result[0] is not None
+    return result is not None
+
+def held_sections(city, lat, lon):
+    """(memo key, {name: result}) for the sections session state already holds for this city."""
+    key = (city.title(), lat, lon)
+    memo = st.session_state.get('sections')
+    return key, (memo[1] if memo and memo[0] == key else {})
+
+def iter_city_sections(key, held, futures):
+    """(name, result) for every section: held ones first, straight from session state, so widget
+    reruns don't go back to the fetch pool; then the started fetches as they complete. Successful
+    results are remembered under key."""
+    yield from list(held.items())
+    fetched = {}
+    for name, result in iter_completed_fetches(futures):
+        if section_ok(name, result):
+            fetched[name] = result
+        yield name, result
+    st.session_state['sections'] = (key, {**held, **fetched})
+
+def iter_completed_fetches(futures, deadline=FETCH_DEADLINE):
+    """Yield (name, result) as each fetch finishes; failures and deadline misses yield None."""
+    pending = dict(futures)
+    try:
+        for fut in as_completed(list(pending), timeout=deadline):
+            name = pending.pop(fut)
+            try:
+                yield name, fut.result()
+            except Exception:
+                yield name, None
+    except FuturesTimeout:
+        for fut, name in pending.items():
+            fut.cancel()
+            yield name, None
+
+# ---- MAP VIEW FRAGMENT (its checkbox and map interactions rerun only this part) ----
+@st.fragment
+def map_view(lat, lon, city_title):
+    # Map view
+    st.markdown("### 🗺 Map View")
+    # small controls
+    map_col1, map_col2 = st.columns([1,3])
+    with map_col1:
+        show_favs_on_map = st.checkbox(get_translation("show_map_favourites"), value=False, key="show_map_favs")
+    with map_col2:
+        show_map(lat, lon, city_title, show_favourites=show_favs_on_map)
 
 # ---- MAIN render weather results (integrates UV, clothing, map, graph) ----
 def render_weather_results(city, current_res):
@@ -599,145 +770,282 @@ def render_weather_results(city, current_res):
         return
 
     is_dark = st.session_state.theme == 'dark'
-    accent = get_temp_based_accent_color(current_res['main']['temp'], is_dark)
+    accent = get_temp_based_accent_color(current_res.temp, is_dark)
     text = "#f0f2f6" if is_dark else "#333333"
 
-    image_url = fetch_unsplash_image_url(city)
-    lat, lon = current_res['coord']['lat'], current_res['coord']['lon']
-    aqi_text = fetch_aqi(lat, lon)
-
-    # Try One Call for UV & daily
-    onecall = fetch_onecall(lat, lon)
-    uvi = None
-    if onecall and 'current' in onecall:
-        uvi = onecall['current'].get('uvi')
-
-    # Convert timestamps
-    sunrise_ts = current_res['sys']['sunrise'] + current_res['timezone']
-    sunset_ts = current_res['sys']['sunset'] + current_res['timezone']
-    sunrise_time = datetime.utcfromtimestamp(sunrise_ts).strftime('%I:%M %p').lstrip('0')
-    sunset_time = datetime.utcfromtimestamp(sunset_ts).strftime('%I:%M %p').lstrip('0')
-
-    left_col_main, right_col_main = st.columns([1.5, 3])
-
-    with left_col_main:
-        if image_url:
-            st.markdown(f'<img class="city-image" src="{image_url}" alt="{city} landmark">', unsafe_allow_html=True)
+    age = st.session_state.get('data_age')
+    if age is not None:
+        note = T("data_age").format(max(1, round(age / 60)))
+        if st.session_state.get('revalidating'):
+            note += " " + T("refreshing")
+        st.caption(note)
+
+    # Kick off image, AQI, One Call and forecast together; the summary and map are drawn while
+    # they run, and the sections fill in as they land
+    lat, lon = current_res.lat, current_res.lon
+    sections_key, held = held_sections(city, lat, lon)
+    futures = start_city_fetches(city, lat, lon, [n for n in SECTIONS if n not in held])
+
+    with metrics.stage("summary"):
+        # Convert timestamps
+        sunrise_ts = current_res.sunrise + current_res.timezone
+        sunset_ts = current_res.sunset + current_res.timezone
+        sunrise_time = datetime.utcfromtimestamp(sunrise_ts).strftime('%I:%M %p').lstrip('0')
+        sunset_time = datetime.utcfromtimestamp(sunset_ts).strftime('%I:%M %p').lstrip('0')
+
+        left_col_main, right_col_main = st.columns([1.5, 3])
+
+        with left_col_main:
+            image_slot = st.empty()
+
+        with right_col_main:
+            st.markdown('<div class="card main-weather-card">', unsafe_allow_html=True)
+            title_slot = st.empty()
+            st.markdown(f"""
+                <h1 class="main-temp">{current_res.temp:.0f} °C</h1>
+                <h3 class="main-condition">{current_res.description}</h3>
+            """, unsafe_allow_html=True)
+
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric(T("feels_like"), f"{current_res.feels_like:.0f} °C")
+            col2.metric(T("humidity"), f"{current_res.humidity} %")
+            col3.metric(T("wind_speed"), f"{current_res.wind_speed} m/s")
+            col4.metric(T("pressure"), f"{current_res.pressure} hPa")
+
+            st.markdown('<div style="height: 15px;"></div>', unsafe_allow_html=True)
+
+            col5, col6, col7 = st.columns(3)
+            col5.metric(T("sunrise"), sunrise_time)
+            col6.metric(T("sunset"), sunset_time)
+            aqi_slot = col7.empty()
+
+            # UV info
+            uv_slot = st.empty()
+
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        main_condition = current_res.condition
+        if main_condition in ["thunderstorm", "rain", "snow"]:
+            st.error(T("severe_alert"))
+
+        # FAVOURITE BUTTON
+        city_title = city.title()
+        if city_title not in st.session_state['favourites']:
+            if st.button(f"{get_translation('add_to_fav')}  {city_title}", key=f"addfav_{city_title}"):
+                add_to_favourites(city_title, lat, lon)
         else:
-            st.markdown(f"<h2 style='color: {accent};'>🏙 {city.title()} {T('weather')}</h2>", unsafe_allow_html=True)
-            st.markdown(f"<p style='color: {text};'>{T('landmark_unavailable')}</p>", unsafe_allow_html=True)
-
-    with right_col_main:
-        st.markdown('<div class="card main-weather-card">', unsafe_allow_html=True)
-        if image_url:
-            st.markdown(f"<h2 style='color: {accent}; margin-top: 0px;'>🏙 {city.title()} {T('weather')}</h2>", unsafe_allow_html=True)
-        st.markdown(f"""
-            <h1 class="main-temp">{current_res['main']['temp']:.0f} °C</h1>
-            <h3 class="main-condition">{current_res['weather'][0]['description'].title()}</h3>
-        """, unsafe_allow_html=True)
-
-        col1, col2, col3, col4 = st.columns(4)
-        col1.metric(T("feels_like"), f"{current_res['main']['feels_like']:.0f} °C")
-        col2.metric(T("humidity"), f"{current_res['main']['humidity']} %")
-        col3.metric(T("wind_speed"), f"{current_res['wind']['speed']} m/s")
-        col4.metric(T("pressure"), f"{current_res['main']['pressure']} hPa")
-
-        st.markdown('<div style="height: 15px;"></div>', unsafe_allow_html=True)
-
-        col5, col6, col7 = st.columns(3)
-        col5.metric(T("sunrise"), sunrise_time)
-        col6.metric(T("sunset"), sunset_time)
-        col7.metric(T("aqi"), aqi_text if aqi_text else "N/A")
-
-        # UV info
-        if uvi is not None:
-            st.markdown(f"**UV Index:** {uvi} — {uv_advice(uvi)}")
-
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    main_condition = current_res['weather'][0]['main'].lower()
-    if main_condition in ["thunderstorm", "rain", "snow"]:
-        st.error(T("severe_alert"))
-
-    # FAVOURITE BUTTON
-    city_title = city.title()
-    if city_title not in st.session_state['favourites']:
-        if st.button(f"{get_translation('add_to_fav')}  {city_title}", key=f"addfav_{city_title}"):
-            add_to_favourites(city_title)
-    else:
-        if st.button(f"{get_translation('remove_from_fav')}  {city_title}", key=f"remfav_{city_title}"):
-            remove_from_favourites(city_title)
-
-    # Clothing suggestion
-    clothes = clothing_suggestion(current_res['main']['temp'], current_res['main'].get('humidity', 0), current_res['wind'].get('speed', 0))
-    st.markdown(f"**Clothing suggestion:** {clothes}")
-
-    # Map view
-    st.markdown("### 🗺 Map View")
-    # small controls
-    map_col1, map_col2 = st.columns([1,3])
-    with map_col1:
-        show_favs_on_map = st.checkbox(get_translation("show_map_favourites"), value=False)
-    with map_col2:
-        # display map (centered at city)
-        show_map(lat, lon, city_title, show_favourites=show_favs_on_map)
-
-    # Hourly + 5-day
-    render_hourly_forecast(city)
-    render_5day_forecast(city)
-
-    # 7-day trend graph using One Call
-    if onecall:
-        render_7day_trend(onecall, city)
+            if st.button(f"{get_translation('remove_from_fav')}  {city_title}", key=f"remfav_{city_title}"):
+                remove_from_favourites(city_title)
+
+        # Clothing suggestion
+        clothes = clothing_suggestion(current_res.temp, current_res.humidity, current_res.wind_speed)
+        st.markdown(f"**Clothing suggestion:** {clothes}")
+
+    with metrics.stage("map"):
+        # display map (centered at city) while the fetches are still in flight
+        map_view(lat, lon, city_title)
+
+    hourly_slot = st.empty()
+    daily_slot = st.empty()
+    trend_slot = st.empty()
+
+    results = {}
+    for name, result in iter_city_sections(sections_key, held, futures):
+        results[name] = result
+        with metrics.stage(name):
+            if name == "image":
+                if result:
+                    image_slot.markdown(f'<img class="city-image" src="{result}" alt="{city} landmark">', unsafe_allow_html=True)
+                    title_slot.markdown(f"<h2 style='color: {accent}; margin-top: 0px;'>🏙 {city.title()} {T('weather')}</h2>", unsafe_allow_html=True)
+                else:
+                    with image_slot.container():
+                        st.markdown(f"<h2 style='color: {accent};'>🏙 {city.title()} {T('weather')}</h2>", unsafe_allow_html=True)
+                        st.markdown(f"<p style='color: {text};'>{T('landmark_unavailable')}</p>", unsafe_allow_html=True)
+            elif name == "aqi":
+                aqi_text = aqi_label(result)
+                aqi_slot.metric(T("aqi"), aqi_text if aqi_text else "N/A")
+            elif name == "onecall":
+                # Try One Call for UV & daily
+                onecall, stale = result if result else (None, False)
+                if stale:
+                    st.warning(T("offline_notice"))
+                if onecall:
+                    uvi = onecall.uvi
+                    if uvi is not None:
+                        uv_slot.markdown(f"**UV Index:** {uvi} — {uv_advice(uvi)}")
+                # 7-day trend graph using One Call
+                if onecall:
+                    with trend_slot.container(), metrics.stage("trend"):
+                        render_7day_trend(onecall, city)
+            elif name == "forecast":
+                # Hourly + 5-day (one shared /forecast fetch)
+                with hourly_slot.container(), metrics.stage("hourly"):
+                    render_hourly_forecast(result)
+                with daily_slot.container(), metrics.stage("daily"):
+                    render_5day_forecast(result)
+
+    # no One Call data: chart the forecast's daily aggregates instead
+    if not (results.get("onecall") or (None, False))[0] and results.get("forecast"):
+        with trend_slot.container(), metrics.stage("trend"):
+            render_forecast_trend(results["forecast"], city)
 
 # ---- fetch_weather_and_data (keeps country checks + caching fallback) ----
+SWR_ENABLED = True
+SWR_MAX_STALE = 6 * 3600  # seconds; older copies are never shown without trying the network first
+CURRENT_DEADLINE = 8  # seconds the script waits for current weather, retries included
+REVALIDATE_POLL = 0.5  # seconds between checks on the background refresh
+
+@st.fragment(run_every=REVALIDATE_POLL)
+def watch_revalidation():
+    """Polls the background refresh without holding the session; reruns the app once it has landed."""
+    pending = st.session_state.get('revalidating')
+    if not pending:
+        return
+    _, future = pending
+    if not future.done():
+        return
+    try:
+        fresh = future.result()
+    except Exception:
+        fresh = None
+    st.session_state['revalidating'] = None
+    if fresh is not None:
+        if st.session_state.get('data_age') is not None:
+            st.session_state['current_weather_data'] = fresh
+            st.session_state['sections'] = None
+            st.session_state['data_age'] = None
+    # rerun either way so the "refreshing" note goes away
+    st.rerun()
+
 def fetch_weather_and_data(city):
     T = get_translation
-    common_countries = [
-        "india", "usa", "china", "canada", "brazil", "russia",
-        "germany", "france", "japan", "australia", "uk", "italy",
-        "spain", "mexico", "pakistan", "indonesia"
-    ]
-    if city.lower() in common_countries:
+    if is_country_name(city):
         st.error(T("country_error"))
         st.session_state['current_weather_data'] = None
         return False
 
+    # a name the gazetteer knows goes upstream in its canonical form; any other name goes as typed
+    st.session_state['city_suggestions'] = []
+    try:
+        match = resolve_city(city)
+    except CityNotFoundError as e:  # GAZETTEER_STRICT only
+        st.error(T("city_not_found").format(city.title()))
+        st.session_state['city_suggestions'] = [c.label for c in e.suggestions]
+        st.session_state['current_weather_data'] = None
+        return False
+    if match is not None:
+        city = get_gazetteer().query_for(match)
+
+    st.session_state['data_age'] = None
+    st.session_state['sections'] = None  # a new lookup refetches every section
+
+    # stale-while-revalidate: show a recent-enough copy now, refresh it off the script thread
+    if SWR_ENABLED and peek_current(city) is None:
+        stale, age = stale_current(city)
+        if stale is not None and age < SWR_MAX_STALE:
+            st.session_state['current_weather_data'] = stale
+            st.session_state['data_age'] = age
+            metrics.record_cache("current", "stale")
+            st.session_state['revalidating'] = (city, submit_fetch(async_fetch.fetch_current(city, force=True)))
+            get_prefetcher().record(city)
+            return True
+
     try:
-        current_url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={API_KEY}&units=metric"
-        current_res = requests.get(current_url, timeout=8).json()
-        if current_res.get("cod") != 200:
-            # fallback to cache
-            cached = load_cached_city(city)
-            if cached:
-                st.warning(get_translation("offline_notice"))
-                st.session_state['current_weather_data'] = cached
-                return True
-            st.error(T("city_not_found").format(city.title()))
-            st.session_state['current_weather_data'] = None
-            return False
-
-        returned_name = current_res.get('name', '').lower()
-        if len(city) <= 6 and city.lower() in common_countries and returned_name not in city.lower():
-            st.error(T("country_error"))
-            st.session_state['current_weather_data'] = None
-            return False
-
-        # cache and save
+        current_res = async_fetch.run(async_fetch.fetch_current(city), timeout=CURRENT_DEADLINE)
+        # cache and save (fetch_current already did)
         st.session_state['current_weather_data'] = current_res
-        cache_city_data(city, current_res)
+        # only names OpenWeather knows count towards the refresher's hot cities
+        get_prefetcher().record(city)
         return True
+    except CityNotFoundError:
+        # fallback to cache
+        cached = load_cached_city(city)
+        if cached:
+            metrics.record_cache("current", "stale")
+            st.warning(get_translation("offline_notice"))
+            st.session_state['current_weather_data'] = cached
+            return True
+        st.error(T("city_not_found").format(city.title()))
+        # OpenWeather doesn't know it either: offer the gazetteer's near matches
+        st.session_state['city_suggestions'] = [c.label for c in get_gazetteer().suggest(city)]
+        st.session_state['current_weather_data'] = None
+        return False
+    except RateLimitedError as e:
+        # quota exhausted (429 or our own scheduler): not a missing city and not offline
+        cached = load_cached_city(city)
+        if cached:
+            metrics.record_cache("current", "stale")
+            st.warning(T("rate_limited_cached"))
+            st.session_state['current_weather_data'] = cached
+            return True
+        st.error(T("rate_limited").format(max(1, round(e.retry_after))))
+        st.session_state['current_weather_data'] = None
+        return False
     except Exception as e:
-        # network error: try cache
+        # network error, or no answer within CURRENT_DEADLINE: try cache
         cached = load_cached_city(city)
         if cached:
+            metrics.record_cache("current", "stale")
             st.warning(get_translation("offline_notice"))
             st.session_state['current_weather_data'] = cached
             return True
-        st.error(T("error_fetching").format(str(e)))
+        st.error(T("error_fetching").format("timed out" if isinstance(e, FuturesTimeout) else str(e)))
         st.session_state['current_weather_data'] = None
         return False
 
+# ---- FAVOURITES DASHBOARD (all favourites at once) ----
+DASHBOARD_TIMEOUT = 5  # seconds per city request
+DASHBOARD_DEADLINE = 8  # seconds for the whole board
+DASHBOARD_COLUMNS = 4
+
+async def fetch_dashboard_city(city):
+    """Current weather for one favourite. Runs on the shared fetch loop."""
+    try:
+        return await async_fetch.fetch_current(city, timeout=DASHBOARD_TIMEOUT)
+    except CityNotFoundError:
+        return None
+
+def render_favourites_dashboard():
+    T = get_translation
+    accent = accent_color
+    text = "#f0f2f6" if st.session_state.theme == 'dark' else "#333333"
+    favourites = list(st.session_state.get('favourites', []))
+
+    st.markdown(f"<h2 style='color: {accent};'>{T('dashboard_header')}</h2>", unsafe_allow_html=True)
+    if not favourites:
+        st.info(T('no_favourites'))
+        return
+
+    futures = {submit_fetch(fetch_dashboard_city(name)): name for name in favourites}
+    results = {}
+    for name, res in iter_completed_fetches(futures, deadline=DASHBOARD_DEADLINE):
+        results[name] = (res, False) if res else (stale_current(name)[0], True)
+
+    for start in range(0, len(favourites), DASHBOARD_COLUMNS):
+        cols = st.columns(DASHBOARD_COLUMNS)
+        for col, name in zip(cols, favourites[start:start + DASHBOARD_COLUMNS]):
+            res, stale = results.get(name, (None, True))
+            with col:
+                if not res:
+                    st.markdown(f"""
+                        <div class="card" style="padding: 12px; text-align: center;">
+                            <h4 style='margin: 0; color: {accent};'>{name}</h4>
+                            <p style='color: {text};'>N/A</p>
+                        </div>
+                    """, unsafe_allow_html=True)
+                    continue
+                icon = FORECAST_ICONS.get(res.condition, "❓")
+                badge = f" <small>({T('cached_label')})</small>" if stale else ""
+                st.markdown(f"""
+                    <div class="card" style="padding: 12px; text-align: center;">
+                        <h4 style='margin: 0; color: {accent};'>{name}{badge}</h4>
+                        <p style='font-size: 1.5rem; margin: 5px 0;'>{icon}</p>
+                        <p style='font-size: 1.3rem; font-weight: bold; margin: 0; color: {text};'>{res.temp:.0f}°C</p>
+                        <p style='font-size: 0.8rem; opacity: 0.8; margin-top: 5px; color: {text};'>{res.description} · {T('humidity')} {res.humidity}%</p>
+                    </div>
+                """, unsafe_allow_html=True)
+    st.markdown("---")
+
 # ---- DISPLAY APP CONTENT (main UI) ----
 def display_app_content():
     T = get_translation
@@ -759,7 +1067,9 @@ def display_app_content():
         # Input & detection
         leftin, rightin = st.columns([3,1])
         with leftin:
-            st.text_input(T("input_label"), key="city_input", on_change=set_search_triggered, placeholder=T("input_placeholder"))
+            st.selectbox(T("input_label"), city_options(), index=None, key="city_input", accept_new_options=True,
+                         on_change=set_search_triggered, placeholder=T("input_placeholder"), format_func=city_option_label)
+            suggestion_slot = st.empty()  # filled once the search below has run
         
 #        with rightin:
 #            if st.button(T("detect_location")):
@@ -774,6 +1084,9 @@ def display_app_content():
         if st.session_state.get('favourites'):
             st.markdown(f"<small style='color: {accent};'>⭐ {T('favourites_header')}: {', '.join(st.session_state['favourites'][:5])}</small>", unsafe_allow_html=True)
 
+        if st.session_state.get('show_dashboard'):
+            render_favourites_dashboard()
+
         city = st.session_state.get('city_input')
 
         if city and st.session_state.get('search_triggered') and st.session_state['current_weather_data'] is None:
@@ -792,27 +1105,41 @@ def display_app_content():
             st.session_state['search_triggered'] = False
         else:
             st.session_state['search_triggered'] = False
+    if st.session_state.get('city_suggestions'):
+        suggestion_slot.pills(T("did_you_mean"), st.session_state['city_suggestions'], key="city_pick", on_change=pick_suggestion)
 
     # Render if data exists
     if st.session_state['current_weather_data'] and city:
         render_weather_results(city, st.session_state['current_weather_data'])
 
 # ---- SIDEBAR (favourites, about, theme, language) ----
-def sidebar_ui():
-    st.sidebar.markdown(f"## {get_translation('favourites_header')}")
+@st.fragment
+def favourites_sidebar():
+    """Favourites list; removing one reruns only this fragment, loading one reruns the app."""
+    st.markdown(f"## {get_translation('favourites_header')}")
+    removed = st.session_state.pop('fav_removed', None)
+    if removed:
+        st.success(get_translation('fav_removed').format(removed))
     if st.session_state.get('favourites'):
-        for fav in st.session_state['favourites']:
-            col1, col2 = st.sidebar.columns([3,1])
+        for fav in list(st.session_state['favourites']):
+            col1, col2 = st.columns([3,1])
             with col1:
                 if st.button(fav, key=f"fav_load_{fav}"):
-                    if fetch_weather_and_data(fav):
-                        st.session_state['search_triggered'] = False
-                        st.session_state['city_input'] = fav
+                    # same as typing the name: the main page does the lookup
+                    st.session_state['city_input'] = fav
+                    st.session_state['search_triggered'] = True
+                    st.rerun()
             with col2:
-                if st.button("🗑", key=f"fav_rm_{fav}", help=get_translation('remove_from_fav')):
-                    remove_from_favourites(fav)
+                # runs before the fragment reruns, so the list above is already updated
+                st.button("🗑", key=f"fav_rm_{fav}", help=get_translation('remove_from_fav'),
+                          on_click=remove_from_favourites, args=(fav,), kwargs={"announce": False})
     else:
-        st.sidebar.info(get_translation('no_favourites'))
+        st.info(get_translation('no_favourites'))
+
+def sidebar_ui():
+    with st.sidebar:
+        favourites_sidebar()
+    st.sidebar.checkbox(get_translation('dashboard_toggle'), key='show_dashboard')
 
     st.sidebar.markdown("---")
     # Map toggle: show all favourites on map quickly
@@ -820,15 +1147,12 @@ def sidebar_ui():
         # If there is at least one favourite, open a small map page
         if st.session_state.get('favourites'):
             st.sidebar.write("Opening map in main view...")
-            # we will detect first favourite coords and show in main
-            first = st.session_state['favourites'][0]
-            # fetch location
-            try:
-                r = requests.get(f"http://api.openweathermap.org/geo/1.0/direct?q={first}&limit=1&appid={API_KEY}", timeout=6).json()
-                if r:
-                    lat = r[0].get('lat'); lon = r[0].get('lon')
-                    show_map(lat, lon, first, show_favourites=True)
-            except Exception:
+            # centre on the first favourite we have coordinates for
+            located = favourite_coordinates()
+            if located:
+                first, lat, lon = located[0]
+                show_map(lat, lon, first, show_favourites=True)
+            else:
                 st.sidebar.warning("Unable to show favourites map right now.")
 
     st.sidebar.markdown("---")
@@ -852,24 +1176,79 @@ def sidebar_ui():
         - Offline cache for last successful results  
         
         **Tech stack:** Python, Streamlit, OpenWeather API, Folium, Matplotlib  
-        **Files created:** favourites.json, cache.json (in app folder)
+        **Files created:** favourites.json, cache.sqlite3 (in app folder)
         """)
     st.sidebar.markdown("---")
     st.sidebar.caption("Made for PBL / Portfolio — customize keys & assets before publishing.")
+    st.sidebar.checkbox(get_translation('debug_timings'), key='show_timings')
+    # filled by render_timing_panel() once the page is drawn
+    return st.sidebar.empty() if st.session_state.get('show_timings') else None
+
+# ---- METRICS (Prometheus endpoint + per-run timing panel) ----
+@st.cache_resource
+def start_metrics_server():
+    """Serve /metrics on METRICS_PORT (once per process) if that variable is set."""
+    port = os.environ.get("METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return metrics.start_http_server(int(port))
+    except Exception:
+        return None
+
+@st.cache_resource
+def start_tile_server():
+    """Serve cached map tiles on 127.0.0.1:TILE_PROXY_PORT (once per process). Only with MAP_TILE_URL set:
+    without it the map can't know the proxy's public address and keeps using the public servers.
+    Also needs TILE_CONTACT (see tile_proxy)."""
+    if not (TILE_PROXY_PORT and MAP_TILE_URL and tile_proxy.TILE_CONTACT):
+        return None
+    try:
+        return tile_proxy.start_tile_proxy(int(TILE_PROXY_PORT))
+    except Exception:
+        return None
+
+def render_timing_panel(slot, trace):
+    if slot is None:
+        return
+    events = trace.snapshot()
+    upstream = [e for e in events if e[0] == "upstream"]
+    with slot.container():
+        st.markdown(f"### {get_translation('timings_header')}")
+        st.caption(f"{trace.elapsed() * 1000:.0f} ms total · {len(upstream)} upstream calls "
+                   f"({sum(e[2] for e in upstream) * 1000:.0f} ms) · "
+                   f"quota headroom {weather_service.quota().headroom():.0%}")
+        st.table([
+            {"kind": kind, "name": name, "ms": round(seconds * 1000, 1), "detail": detail}
+            for kind, name, seconds, detail in events
+        ])
 
 # ---- APP ENTRY ----
 # Determine accent and background (try to reuse logic from earlier)
 local_image_path = "bright_day_light.jpg"
-base64_image = get_base64_image(local_image_path)
-if base64_image:
-    default_bg = f"url('data:image/jpeg;base64,{base64_image}') no-repeat center center fixed"
+bg_assets = prepare_background_assets(local_image_path)
+if bg_assets:
+    default_bg = f"url('{bg_assets[0][1]}') no-repeat center center fixed"
 else:
     default_bg = 'linear-gradient(135deg, #CFD8DC 0%, #B0BEC5 50%, #78909C 100%)' if st.session_state.theme=='light' else 'linear-gradient(135deg, #1C2833 0%, #2C3E50 50%, #4A637A 100%)'
 dynamic_bg_style = default_bg
 
 
-apply_dynamic_css(dynamic_bg_style, accent_color)
+apply_dynamic_css(dynamic_bg_style, accent_color, background_media_css(bg_assets))
+
+seed_image_index()
+
+# favourites are always kept warm by the background refresher
+get_prefetcher().pin(st.session_state.get('favourites', []))
 
 # render sidebar & main
-sidebar_ui()
+start_metrics_server()
+start_tile_server()
+run_trace = metrics.Trace()
+metrics.set_trace(run_trace)
+timing_slot = sidebar_ui()
 display_app_content()
+render_timing_panel(timing_slot, run_trace)
+# only while a refresh is pending, so the poll stops with the rerun that shows its result
+if st.session_state.get('revalidating'):
+    watch_revalidation()
@@ -0,0 +1,188 @@
+"""Background refresher that keeps the most requested cities warm in the shared cache.
+
+Cities are scored by how often they are successfully looked up (with
+exponential decay, so yesterday's spike fades) plus a fixed boost for
+favourites; cities whose score decays below MIN_SCORE are forgotten. A daemon
+thread re-fetches each (city, endpoint) of the top N shortly before its cache
+entry expires, without exceeding a per-minute request budget. A city whose
+refresh fails is left alone for an exponentially growing backoff.
+"""
+import threading
+import time
+
+TOP_N = 20
+LEAD_TIME = 60  # seconds before TTL expiry that a refresh is due
+BUDGET_PER_MINUTE = 30  # upstream requests the refresher may spend
+INTERVAL = 15  # seconds between scheduling passes
+HALF_LIFE = 3600  # seconds for a request's weight to halve
+PINNED_SCORE = 1.0  # favourites always count as at least one recent request
+MIN_SCORE = 0.125  # below this (one request three half-lives ago) a city is no longer tracked
+BACKOFF_BASE = 60  # seconds a city is skipped after its first failed refresh; doubles per failure
+BACKOFF_MAX = 6 * 3600
+
+
+def _norm(city):
+    return " ".join(city.split()).title()
+
+
+class Refresher:
+    def __init__(self, tasks, age_fn, ttl_fn, top_n=TOP_N, lead_time=LEAD_TIME,
+                 budget_per_minute=BUDGET_PER_MINUTE, interval=INTERVAL):
+        """tasks: {endpoint: refresh(city) -> bool}, run in dict order.
+        age_fn(endpoint, city): age in seconds of the cached entry, or None if absent.
+        ttl_fn(endpoint): freshness TTL for that endpoint.
+        """
+        self.tasks = tasks
+        self.age_fn = age_fn
+        self.ttl_fn = ttl_fn
+        self.top_n = top_n
+        self.lead_time = lead_time
+        self.budget_per_minute = budget_per_minute
+        self.interval = interval
+        self._scores = {}  # city -> (score, updated_at)
+        self._pinned = set()
+        self._backoff = {}  # city -> (consecutive failures, retry at)
+        self._tokens = float(budget_per_minute)
+        self._tokens_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped_for_budget = 0
+
+    # ---- demand tracking ----
+    def _decayed(self, city, now):
+        score, at = self._scores.get(city, (0.0, now))
+        return score * 0.5 ** ((now - at) / HALF_LIFE)
+
+    def record(self, city):
+        """Count one successful lookup of city."""
+        if not city:
+            return
+        city = _norm(city)
+        now = time.time()
+        with self._lock:
+            self._scores[city] = (self._decayed(city, now) + 1.0, now)
+
+    def pin(self, cities):
+        with self._lock:
+            self._pinned = {_norm(c) for c in cities if c}
+
+    def hot_cities(self):
+        """The top N cities by decayed score; forgets unpinned cities below MIN_SCORE."""
+        now = time.time()
+        with self._lock:
+            scores = {c: self._decayed(c, now) for c in self._scores}
+            for city, score in scores.items():
+                if score < MIN_SCORE and city not in self._pinned:
+                    del self._scores[city]
+                    self._backoff.pop(city, None)
+            ranked = sorted(
+                set(self._scores) | self._pinned,
+                key=lambda c: scores.get(c, 0.0) + (PINNED_SCORE if c in self._pinned else 0.0),
+                reverse=True,
+            )
+        return ranked[:self.top_n]
+
+    # ---- per-city backoff for failing refreshes ----
+    def backing_off(self, city, now):
+        with self._lock:
+            return self._backoff.get(city, (0, 0.0))[1] > now
+
+    def _note_result(self, city, ok, now):
+        with self._lock:
+            if ok:
+                self._backoff.pop(city, None)
+                return
+            failures = self._backoff.get(city, (0, 0.0))[0] + 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1))
+            self._backoff[city] = (failures, now + delay)
+
+    # ---- request budget (token bucket refilled continuously) ----
+    def _take_token(self):
+        with self._lock:
+            now = time.monotonic()
+            rate = self.budget_per_minute / 60.0
+            self._tokens = min(self.budget_per_minute, self._tokens + (now - self._tokens_at) * rate)
+            self._tokens_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    # ---- scheduling ----
+    def is_due(self, endpoint, city):
+        age = self.age_fn(endpoint, city)
+        return age is None or age >= self.ttl_fn(endpoint) - self.lead_time
+
+    def run_once(self):
+        """One scheduling pass. Returns the number of refreshes attempted."""
+        attempted = 0
+        for city in self.hot_cities():
+            if self.backing_off(city, time.time()):
+                continue
+            for endpoint, refresh in self.tasks.items():
+                try:
+                    due = self.is_due(endpoint, city)
+                except Exception:
+                    due = False
+                if not due:
+                    continue
+                if not self._take_token():
+                    self.skipped_for_budget += 1
+                    return attempted
+                attempted += 1
+                try:
+                    ok = refresh(city)
+                except Exception:
+                    ok = False
+                self._note_result(city, ok, time.time())
+                if ok:
+                    self.refreshed += 1
+                else:
+                    self.failed += 1
+                    break  # the city's other endpoints wait for its backoff too
+        return attempted
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                pass
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="weather-prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "tracked": len(self._scores),
+            "pinned": len(self._pinned),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "backing_off": sum(1 for _, retry_at in self._backoff.values() if retry_at > time.time()),
+            "skipped_for_budget": self.skipped_for_budget,
+            "hot": self.hot_cities(),
+        }
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def get_refresher(tasks, age_fn, ttl_fn, **options):
+    """The process-wide Refresher; started on first call, later arguments are ignored."""
+    global _refresher
+    if _refresher is None:
+        with _refresher_lock:
+            if _refresher is None:
+                _refresher = Refresher(tasks, age_fn, ttl_fn, **options).start()
+    return _refresher
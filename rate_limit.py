@@ -0,0 +1,258 @@
+"""Process-wide scheduling for the shared OpenWeather API key.
+
+Every session (and the background refresher) spends the same per-minute
+quota. Calls go through get_scheduler().call(key, fn):
+
+- identical concurrent requests (same key) are coalesced into one upstream call;
+- a token bucket caps the request rate; interactive callers queue briefly for
+  a token, background callers never queue and never dip into the reserve
+  kept for interactive traffic;
+- a 429 from upstream pauses the bucket for Retry-After seconds.
+
+Coroutines (async_fetch) use acquire_async() and call_async(), which wait with
+asyncio.sleep instead of blocking their event loop, and share the same bucket
+and in-flight table as the threads.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import metrics
+
+CALLS_PER_MINUTE = 60  # OpenWeather free tier
+RESERVE = 0.2  # share of the bucket only interactive requests may use
+QUEUE_TIMEOUT = 5.0  # seconds an interactive request may wait for a token
+DEFAULT_RETRY_AFTER = 60
+
+
+class RateLimitedError(RuntimeError):
+    """No quota right now: upstream answered 429, or no token was free in time."""
+
+    def __init__(self, message="rate limited", retry_after=DEFAULT_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_local = threading.local()
+
+
+@contextmanager
+def background():
+    """Mark calls made by this thread inside the block as background (lowest priority)."""
+    previous = getattr(_local, "background", False)
+    _local.background = True
+    try:
+        yield
+    finally:
+        _local.background = previous
+
+
+def as_background(fn):
+    def run(*args, **kwargs):
+        with background():
+            return fn(*args, **kwargs)
+    return run
+
+
+def is_background():
+    return getattr(_local, "background", False)
+
+
+class QuotaScheduler:
+    def __init__(self, per_minute=CALLS_PER_MINUTE, reserve=RESERVE, queue_timeout=QUEUE_TIMEOUT):
+        self.capacity = float(max(1, per_minute))
+        self.rate = self.capacity / 60.0
+        self.reserve = self.capacity * reserve
+        self.queue_timeout = queue_timeout
+        self._tokens = self.capacity
+        self._tokens_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = 0  # interactive callers queued for a token
+        self._cond = threading.Condition()
+        self._inflight = {}  # key -> Future of the leader's call
+        self._inflight_lock = threading.Lock()
+        self._leaders = set()  # call_async leader tasks; the loop only keeps weak references
+
+    # ---- token bucket ----
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._tokens_at) * self.rate)
+        self._tokens_at = now
+
+    def acquire(self, background=False, timeout=None):
+        """Take one token. Returns False if none could be had (background: immediately)."""
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            if background:
+                if now < self._paused_until or self._waiting or self._tokens - 1 < self.reserve:
+                    metrics.REGISTRY.inc("weather_quota_events_total", event="background_deferred")
+                    return False
+                self._tokens -= 1
+                return True
+            deadline = now + timeout
+            waited = False
+            self._waiting += 1
+            try:
+                while True:
+                    if now >= self._paused_until and self._tokens >= 1:
+                        self._tokens -= 1
+                        if waited:
+                            metrics.REGISTRY.inc("weather_quota_events_total", event="queued")
+                        return True
+                    if now >= deadline:
+                        metrics.REGISTRY.inc("weather_quota_events_total", event="rejected")
+                        return False
+                    ready_in = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+                    waited = True
+                    self._cond.wait(min(ready_in, deadline - now))
+                    now = time.monotonic()
+                    self._refill(now)
+            finally:
+                self._waiting -= 1
+
+    async def acquire_async(self, background=False, timeout=None):
+        """acquire() for coroutines: waits on the event loop instead of blocking it."""
+        if background:
+            return self.acquire(background=True)
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        with self._cond:
+            self._waiting += 1
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now >= self._paused_until and self._tokens >= 1:
+                        self._tokens -= 1
+                        if waited:
+                            metrics.REGISTRY.inc("weather_quota_events_total", event="queued")
+                        return True
+                    if now >= deadline:
+                        metrics.REGISTRY.inc("weather_quota_events_total", event="rejected")
+                        return False
+                    ready_in = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+                waited = True
+                await asyncio.sleep(min(ready_in, deadline - now))
+        finally:
+            with self._cond:
+                self._waiting -= 1
+
+    def note_rate_limited(self, retry_after=None):
+        """Upstream said 429: stop sending until Retry-After has passed."""
+        try:
+            retry_after = float(retry_after)
+        except (TypeError, ValueError):
+            retry_after = DEFAULT_RETRY_AFTER
+        metrics.REGISTRY.inc("weather_quota_events_total", event="upstream_429")
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._tokens = 0.0
+        return retry_after
+
+    def retry_after(self):
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return max(self._paused_until - now, (1 - self._tokens) / self.rate, 0.0)
+
+    def headroom(self):
+        """Fraction of the burst capacity currently available (0 while paused by a 429)."""
+        with self._cond:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return 0.0
+            self._refill(now)
+            return self._tokens / self.capacity
+
+    # ---- coalescing + scheduling ----
+    def call(self, key, fn):
+        """fn() at most once for all concurrent callers with the same key; needs a token."""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            metrics.REGISTRY.inc("weather_quota_events_total", event="coalesced")
+            return future.result()
+        try:
+            if not self.acquire(background=is_background()):
+                raise RateLimitedError("OpenWeather quota exhausted", retry_after=self.retry_after())
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    async def call_async(self, key, coro_fn, background=False):
+        """call() for coroutines; coalesces with threads and other coroutines on the same key.
+
+        The upstream call runs in a task of its own and every caller waits on it through
+        asyncio.shield, so a caller that is cancelled (a page past its deadline) leaves the
+        shared request, and everyone else waiting on it, untouched.
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if leader:
+            task = asyncio.ensure_future(self._lead_async(key, coro_fn, background, future))
+            self._leaders.add(task)
+            task.add_done_callback(self._leaders.discard)
+        else:
+            metrics.REGISTRY.inc("weather_quota_events_total", event="coalesced")
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def _lead_async(self, key, coro_fn, background, future):
+        try:
+            if not await self.acquire_async(background=background):
+                raise RateLimitedError("OpenWeather quota exhausted", retry_after=self.retry_after())
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            # only when the loop itself shuts down; waiters get an ordinary error, not a cancellation
+            future.set_exception(ConnectionError("upstream request cancelled"))
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._inflight_lock:
+            inflight = len(self._inflight)
+        return {
+            "headroom": round(self.headroom(), 3),
+            "calls_per_minute": round(self.rate * 60, 1),
+            "waiting": self._waiting,
+            "in_flight": inflight,
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(per_minute=CALLS_PER_MINUTE):
+    """The process-wide QuotaScheduler; per_minute applies on first call only."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = QuotaScheduler(per_minute)
+                metrics.register_gauge("weather_quota_headroom_ratio", _scheduler.headroom,
+                                       "Share of the OpenWeather request bucket currently free.")
+    return _scheduler
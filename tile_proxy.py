@@ -0,0 +1,338 @@
+"""Local caching proxy for OpenStreetMap tiles.
+
+    python tile_proxy.py --port 8766                      # serve tiles/z/x/y.png
+    python tile_proxy.py --seed 28.61,77.21 --seed-favourites favourites.json --seed-only
+
+Browsers ask the proxy for /{z}/{x}/{y}.png. Tiles come from a disk cache
+(TILE_CACHE_DIR/z/x/y.png) or are fetched once from TILE_UPSTREAM and kept.
+The cache is bounded by size (TILE_CACHE_MB): the least recently served tiles
+are deleted first, and access times survive restarts as file mtimes. seed()
+fetches the tiles around given coordinates ahead of time, so repeat map loads
+for favourite cities never leave the machine.
+
+Browsers fetch the tiles, so the app points the map at MAP_TILE_URL, the
+address they reach the proxy at (e.g. https://weather.example.com/tiles/{z}/{x}/{y}.png
+behind a reverse proxy). With MAP_TILE_URL set, TILE_PROXY_PORT also runs the
+proxy inside the Streamlit process.
+
+The OSM tile usage policy applies to everything fetched through the proxy, so it
+listens on 127.0.0.1 only (the reverse proxy forwards to it), refuses zoom
+levels above MAX_ZOOM, and will not start without TILE_CONTACT: the policy
+requires a User-Agent saying how to reach whoever runs it. Seeding is
+deliberately small (one zoom, a 3x3 block per city) and runs on a single
+thread, as the policy forbids bulk downloads.
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+from http_client import get_client
+
+TILE_UPSTREAM = os.environ.get("TILE_UPSTREAM", "https://tile.openstreetmap.org/{z}/{x}/{y}.png")
+TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR", os.path.join(os.getcwd(), "tiles"))
+TILE_CACHE_MB = float(os.environ.get("TILE_CACHE_MB", 256))
+MAX_ZOOM = int(os.environ.get("TILE_MAX_ZOOM", 16))  # the app's map stops here too
+# contact details for the User-Agent, e.g. "https://weather.example.com; ops@example.com"
+TILE_CONTACT = os.environ.get("TILE_CONTACT", "")
+SEED_ZOOMS = (10,)  # the zoom the app opens its map at
+SEED_RADIUS = 1  # tiles on each side of the centre tile
+BROWSER_MAX_AGE = 7 * 24 * 3600
+
+TILE_PATH = re.compile(r"^/(\d+)/(\d+)/(\d+)\.png$")
+
+metrics.HELP["weather_tile_requests_total"] = "Map tiles served by the tile proxy, by result (hit, fetched, error)."
+
+
+def tile_xy(lat, lon, zoom):
+    """Slippy-map tile (x, y) containing lat/lon at zoom."""
+    n = 2 ** zoom
+    lat = max(-85.0511, min(85.0511, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_around(lat, lon, zoom, radius=SEED_RADIUS):
+    """(z, x, y) of the block of tiles centred on lat/lon; x wraps around the antimeridian."""
+    n = 2 ** zoom
+    cx, cy = tile_xy(lat, lon, zoom)
+    return [
+        (zoom, (cx + dx) % n, cy + dy)
+        for dy in range(-radius, radius + 1) if 0 <= cy + dy < n
+        for dx in range(-radius, radius + 1)
+    ]
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+class TileCache:
+    """z/x/y.png files under root, evicted least recently used first once over max_bytes."""
+
+    def __init__(self, root=TILE_CACHE_DIR, max_bytes=int(TILE_CACHE_MB * 1024 * 1024)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._sizes = OrderedDict()  # (z, x, y) -> bytes, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _path(self, z, x, y):
+        return os.path.join(self.root, str(z), str(x), f"{y}.png")
+
+    def _scan(self):
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    parts = os.path.relpath(path, self.root).split(os.sep)
+                    key = (int(parts[0]), int(parts[1]), int(parts[2][:-len(".png")]))
+                    stat = os.stat(path)
+                except (IndexError, ValueError, OSError):
+                    continue
+                found.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(found):
+            self._sizes[key] = size
+            self._total += size
+        self._evict()
+
+    def get(self, z, x, y):
+        key = (z, x, y)
+        with self._lock:
+            if key not in self._sizes:
+                return None
+            self._sizes.move_to_end(key)
+        path = self._path(z, x, y)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # LRU order for the next process
+            return data
+        except OSError:
+            with self._lock:
+                self._total -= self._sizes.pop(key, 0)
+            return None
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._sizes
+
+    def put(self, z, x, y, data):
+        path = self._path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)  # readers never see half a tile
+        with self._lock:
+            self._total += len(data) - self._sizes.pop((z, x, y), 0)
+            self._sizes[(z, x, y)] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._sizes:
+            (z, x, y), size = self._sizes.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(z, x, y))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"tiles": len(self._sizes), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+class TileProxy:
+    def __init__(self, cache=None, upstream=TILE_UPSTREAM, contact=TILE_CONTACT):
+        if not contact:
+            raise ValueError("TILE_CONTACT is required: tile servers must be able to reach the operator")
+        self.cache = cache or TileCache()
+        self.upstream = upstream
+        self.headers = {"User-Agent": f"WeatherNow/1.0 tile proxy (+{contact})"}
+        self._seed_queue = queue.Queue()
+        self._seeded = set()  # (z, x, y) already queued for seeding
+        self._seeder = None
+        self._lock = threading.Lock()
+
+    def tile(self, z, x, y):
+        """PNG bytes for the tile, from disk or upstream; None if upstream has none."""
+        data = self.cache.get(z, x, y)
+        if data is not None:
+            metrics.REGISTRY.inc("weather_tile_requests_total", result="hit")
+            return data
+        try:
+            response = get_client().get(self.upstream.format(z=z, x=x, y=y), endpoint="tiles", headers=self.headers)
+        except Exception:
+            response = None
+        if response is None or response.status_code != 200 or not response.content:
+            metrics.REGISTRY.inc("weather_tile_requests_total", result="error")
+            return None
+        self.cache.put(z, x, y, response.content)
+        metrics.REGISTRY.inc("weather_tile_requests_total", result="fetched")
+        return response.content
+
+    # ---- seeding ----
+    def seed(self, points, zooms=SEED_ZOOMS, radius=SEED_RADIUS):
+        """Fetch the tiles around each (lat, lon) now. Returns {"cached": n, "fetched": n, "failed": n}."""
+        counts = {"cached": 0, "fetched": 0, "failed": 0}
+        for key in self._seed_tiles(points, zooms, radius):
+            if key in self.cache:
+                counts["cached"] += 1
+            elif self.tile(*key) is None:
+                counts["failed"] += 1
+            else:
+                counts["fetched"] += 1
+        return counts
+
+    def seed_in_background(self, points, zooms=SEED_ZOOMS, radius=SEED_RADIUS):
+        """Queue the tiles around each (lat, lon) for one background thread; tiles already queued are skipped."""
+        with self._lock:
+            fresh = [key for key in self._seed_tiles(points, zooms, radius) if key not in self._seeded]
+            self._seeded.update(fresh)
+            if self._seeder is None:
+                self._seeder = threading.Thread(target=self._seed_loop, name="tile-seeder", daemon=True)
+                self._seeder.start()
+        for key in fresh:
+            self._seed_queue.put(key)
+        return len(fresh)
+
+    def _seed_tiles(self, points, zooms, radius):
+        seen = set()
+        for lat, lon in points:
+            for zoom in zooms:
+                for key in tiles_around(lat, lon, zoom, radius):
+                    if key not in seen:
+                        seen.add(key)
+                        yield key
+
+    def _seed_loop(self):
+        while True:
+            key = self._seed_queue.get()
+            if key not in self.cache:
+                self.tile(*key)
+
+    def stats(self):
+        return {**self.cache.stats(), "seed_queue": self._seed_queue.qsize()}
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/__stats":
+            self.send_body(200, json.dumps(self.server.proxy.stats()).encode("utf-8"), "application/json")
+            return
+        match = TILE_PATH.match(path)
+        if not match or not valid_tile(*map(int, match.groups())):
+            self.send_body(404, b"not a tile", "text/plain")
+            return
+        data = self.server.proxy.tile(*map(int, match.groups()))
+        if data is None:
+            self.send_body(502, b"tile unavailable", "text/plain")
+            return
+        self.send_body(200, data, "image/png", {"Cache-Control": f"public, max-age={BROWSER_MAX_AGE}"})
+
+
+def start_tile_proxy(port, host="127.0.0.1", proxy=None):
+    """Serve tiles on their own daemon thread; returns the server (its TileProxy is server.proxy).
+    Keep host on loopback and expose it through the reverse proxy, never directly."""
+    server = ThreadingHTTPServer((host, port), _TileHandler)
+    server.daemon_threads = True
+    server.proxy = proxy or get_tile_proxy()
+    threading.Thread(target=server.serve_forever, name="tile-proxy", daemon=True).start()
+    return server
+
+
+_proxy = None
+_proxy_lock = threading.Lock()
+
+
+def get_tile_proxy():
+    """The process-wide TileProxy over TILE_CACHE_DIR, created on first use."""
+    global _proxy
+    if _proxy is None:
+        with _proxy_lock:
+            if _proxy is None:
+                _proxy = TileProxy()
+                metrics.register_gauge("weather_tile_cache_bytes", lambda: _proxy.cache.stats()["bytes"],
+                                       "Bytes of map tiles held in the tile proxy's disk cache.")
+    return _proxy
+
+
+def favourite_points(path):
+    """(lat, lon) of the favourites in the app's favourites.json that have coordinates."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return [(e["lat"], e["lon"]) for e in entries
+            if isinstance(e, dict) and e.get("lat") is not None and e.get("lon") is not None]
+
+
+def parse_point(value):
+    lat, _, lon = value.partition(",")
+    return float(lat), float(lon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caching OpenStreetMap tile proxy")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("TILE_PROXY_PORT", 8766)))
+    parser.add_argument("--seed", action="append", type=parse_point, default=[], metavar="LAT,LON",
+                        help="pre-fetch the tiles around this point (repeatable)")
+    parser.add_argument("--seed-favourites", metavar="FAVOURITES_JSON", help="pre-fetch around every favourite")
+    parser.add_argument("--zooms", type=lambda v: tuple(int(z) for z in v.split(",")), default=SEED_ZOOMS,
+                        help="comma-separated zoom levels to seed")
+    parser.add_argument("--radius", type=int, default=SEED_RADIUS)
+    parser.add_argument("--seed-only", action="store_true", help="seed and exit instead of serving")
+    args = parser.parse_args()
+    if not TILE_CONTACT:
+        parser.error("set TILE_CONTACT (a URL or e-mail address) before fetching OSM tiles")
+
+    proxy = get_tile_proxy()
+    points = args.seed + (favourite_points(args.seed_favourites) if args.seed_favourites else [])
+    if points:
+        started = time.perf_counter()
+        counts = proxy.seed(points, args.zooms, args.radius)
+        print(f"seeded {len(points)} points in {time.perf_counter() - started:.1f}s: {counts}")
+    if args.seed_only:
+        return
+    server = start_tile_proxy(args.port, args.host, proxy)
+    print(f"tile proxy on http://{args.host}:{server.server_address[1]}/{{z}}/{{x}}/{{y}}.png "
+          f"(cache {proxy.cache.root}, {proxy.cache.stats()['tiles']} tiles)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
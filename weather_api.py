@@ -0,0 +1,135 @@
+"""Headless JSON API over weather_service, for clients that don't need the Streamlit page.
+
+    python weather_api.py --port 8080 --workers 4
+
+Endpoints:
+    GET /v1/weather?city=Delhi            current, AQI, UV, clothing tip, daily and forecast
+    GET /v1/forecast?city=Delhi           parsed 5-day/3-hour forecast
+    GET /v1/forecast?lat=28.6&lon=77.2
+    GET /healthz
+    GET /metrics                          Prometheus text format
+
+Fetches run on async_fetch's shared loop and connection pool; handlers await
+them there, so no thread is tied up per request. With --workers > 1 every
+process binds the same port (SO_REUSEPORT); they share cached responses
+through the SQLite store.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+
+from aiohttp import web
+
+import async_fetch
+import metrics
+import weather_service
+from weather_service import CityNotFoundError, RateLimitedError, get_cache_store
+from http_client import get_client
+from weather_cache import shared_cache
+
+DEFAULT_PORT = 8080
+
+
+def json_error(status, message, **extra):
+    return web.json_response({"error": message, **extra}, status=status)
+
+
+async def run_shared(coro):
+    """Await a coroutine on async_fetch's loop, which owns the upstream connection pool."""
+    return await asyncio.wrap_future(async_fetch.submit(coro))
+
+
+async def weather(request):
+    city = request.query.get("city", "").strip()
+    if not city:
+        return json_error(400, "city is required")
+    if weather_service.is_country_name(city):
+        return json_error(400, "please enter a city, not a country")
+    try:
+        bundle = await run_shared(async_fetch.city_bundle_json(city))
+    except CityNotFoundError as e:
+        return json_error(404, f"city not found: {city}", suggestions=[c.to_dict() for c in e.suggestions])
+    except RateLimitedError as e:
+        response = json_error(429, "upstream quota exhausted, retry later")
+        response.headers["Retry-After"] = str(max(1, round(e.retry_after)))
+        return response
+    except Exception:
+        return json_error(502, "weather provider unavailable")
+    return web.json_response(bundle)
+
+
+async def forecast(request):
+    city = request.query.get("city", "").strip() or None
+    try:
+        lat = float(request.query["lat"]) if "lat" in request.query else None
+        lon = float(request.query["lon"]) if "lon" in request.query else None
+    except ValueError:
+        return json_error(400, "lat and lon must be numbers")
+    if city is None and (lat is None or lon is None):
+        return json_error(400, "city or lat and lon are required")
+    result = await run_shared(async_fetch.fetch_forecast(city, lat, lon))
+    if result is None:
+        return json_error(502, "forecast unavailable")
+    return web.json_response(result.to_dict())
+
+
+async def metrics_text(request):
+    return web.Response(body=metrics.render().encode("utf-8"), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def healthz(request):
+    return web.json_response({
+        "status": "ok",
+        "pid": os.getpid(),
+        "cache": shared_cache().stats(),
+        "quota": weather_service.quota().stats(),
+        "breakers": get_client().breaker_states(),  # shared by the sync and async clients
+    })
+
+
+def make_app():
+    app = web.Application()
+    app.router.add_get("/v1/weather", weather)
+    app.router.add_get("/v1/forecast", forecast)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics_text)
+    return app
+
+
+def serve(host, port, reuse_port=False, workers=1):
+    # every worker spends the same API key, so each gets an equal share of its quota
+    weather_service.configure(quota_share=1.0 / workers)
+    get_cache_store()  # create the schema / migrate cache.json before the first request
+    web.run_app(make_app(), host=host, port=port, reuse_port=reuse_port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("WEATHER_API_PORT", DEFAULT_PORT)))
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        serve(args.host, args.port)
+        return
+    get_cache_store()  # migrate once in the parent, not concurrently in every worker
+    # spawn, not fork: the parent's SQLite connection must not be inherited
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=serve, args=(args.host, args.port, True, args.workers), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for p in workers:
+        p.start()
+    try:
+        for p in workers:
+            p.join()
+    except KeyboardInterrupt:
+        for p in workers:
+            p.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Process-wide TTL + LRU cache for OpenWeather responses.
+
+Streamlit re-executes new.py on every rerun, so anything that must outlive a
+session (or be shared between sessions) lives in an imported module like this.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a response stays fresh, per endpoint
+ENDPOINT_TTLS = {
+    "current": 10 * 60,
+    "forecast": 30 * 60,
+    "onecall": 30 * 60,
+    "air_pollution": 30 * 60,
+    "geocoding": 365 * 24 * 3600,  # city coordinates don't move
+    "unsplash": 30 * 24 * 3600,  # landmark photos rarely change
+}
+DEFAULT_TTL = 10 * 60
+MAX_ENTRIES = 5000
+MAX_BYTES = 32 * 1024 * 1024
+
+
+def normalize_query(params):
+    """Stable string for a query: case/whitespace-insensitive names, lat/lon rounded to ~10 m."""
+    parts = []
+    for k in sorted(params):
+        v = params[k]
+        if isinstance(v, float):
+            v = f"{v:.4f}"
+        else:
+            v = " ".join(str(v).split()).lower()
+        parts.append(f"{k}={v}")
+    return "&".join(parts)
+
+
+def make_key(endpoint, params):
+    return f"{endpoint}:{normalize_query(params)}"
+
+
+def _approx_size(value):
+    if hasattr(value, "to_dict"):  # forecast_model records
+        value = value.to_dict()
+    try:
+        return len(json.dumps(value, separators=(",", ":"), ensure_ascii=False))
+    except Exception:
+        return 1024
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-endpoint TTLs and an approximate memory bound.
+
+    Expired entries are kept (until evicted) so callers can still fall back to
+    them with get_stale() when the network is down.
+    """
+
+    def __init__(self, ttls=None, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.ttls = dict(ENDPOINT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, stored_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def ttl_for(self, endpoint):
+        return self.ttls.get(endpoint, DEFAULT_TTL)
+
+    def get(self, endpoint, params):
+        """Return the cached value if still fresh, else None."""
+        key = make_key(endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] < self.ttl_for(endpoint):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def get_stale(self, endpoint, params):
+        """Return (value, age_seconds) regardless of TTL, or (None, None)."""
+        key = make_key(endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            return entry[0], time.time() - entry[1]
+
+    def set(self, endpoint, params, value, stored_at=None):
+        """Insert or replace; stored_at lets a copy loaded from elsewhere keep its real age."""
+        key = make_key(endpoint, params)
+        size = _approx_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, time.time() if stored_at is None else stored_at, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """The one TTLCache for this process, created on first use."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = TTLCache()
+    return _shared
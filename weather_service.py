@@ -0,0 +1,602 @@
+"""UI-independent weather service layer.
+
+Everything here is plain Python: no st.session_state, st.warning or st.error.
+new.py (the Streamlit page), weather_api.py (the headless HTTP endpoint) and
+the background refresher all call into this module, so they share one
+in-memory cache per process and one SQLite store across processes.
+"""
+import os
+import threading
+import time
+
+import metrics
+from cache_store import open_store
+from forecast_model import CurrentWeather, DailyOutlook, ForecastSeries, to_json
+from gazetteer import get_gazetteer
+from http_client import get_client, get_budget
+from prefetch import get_refresher, TOP_N, BUDGET_PER_MINUTE
+from rate_limit import RateLimitedError, as_background, get_scheduler, CALLS_PER_MINUTE
+from weather_cache import make_key, shared_cache
+
+# ---- CONFIGURATION ----
+API_KEY = os.environ.get("OPENWEATHER_API_KEY", "")
+UNSPLASH_ACCESS_KEY = os.environ.get("UNSPLASH_ACCESS_KEY", "")
+# overridable so the benchmarks (bench/) can point everything at a local stand-in server
+OPENWEATHER_URL = os.environ.get("OPENWEATHER_BASE_URL", "https://api.openweathermap.org").rstrip("/")
+UNSPLASH_API_URL = os.environ.get("UNSPLASH_API_URL", "https://api.unsplash.com/search/photos")
+UNSPLASH_BUDGET_PER_HOUR = 40  # demo keys allow 50/hour; keep headroom for other deployments
+
+CACHE_FILE = os.path.join(os.getcwd(), "cache.json")  # legacy, migrated into CACHE_DB
+CACHE_DB = os.environ.get("WEATHER_CACHE_DB", os.path.join(os.getcwd(), "cache.sqlite3"))
+
+IMAGE_TTL = 30 * 24 * 3600  # landmark photos rarely change
+IMAGE_NEGATIVE_TTL = 24 * 3600  # "no results" is remembered for a day
+GEOCODE_TTL = 365 * 24 * 3600  # city coordinates don't move
+# the key's quota per minute; QUOTA_SHARE is this process's part of it (weather_api workers split it)
+QUOTA_PER_MINUTE = int(os.environ.get("OPENWEATHER_CALLS_PER_MINUTE", CALLS_PER_MINUTE))
+QUOTA_SHARE = 1.0
+# reject every name the gazetteer doesn't know (use with a full GAZETTEER_FILE); by default
+# names it doesn't list are asked upstream, and suggestions only follow an upstream 404
+GAZETTEER_STRICT = os.environ.get("GAZETTEER_STRICT", "") not in ("", "0")
+
+
+def configure(api_key=None, unsplash_key=None, cache_db=None, quota_share=None):
+    """Override the environment defaults (new.py passes its st.secrets here)."""
+    global API_KEY, UNSPLASH_ACCESS_KEY, CACHE_DB, QUOTA_SHARE
+    if api_key is not None:
+        API_KEY = api_key
+    if unsplash_key is not None:
+        UNSPLASH_ACCESS_KEY = unsplash_key
+    if cache_db is not None:
+        CACHE_DB = cache_db
+    if quota_share is not None:
+        QUOTA_SHARE = quota_share
+
+
+class CityNotFoundError(LookupError):
+    """No such city: OpenWeather answered 404, or (GAZETTEER_STRICT) the gazetteer doesn't list it."""
+
+    def __init__(self, message="", suggestions=()):
+        super().__init__(message)
+        self.suggestions = list(suggestions)  # gazetteer Cities the user may have meant
+
+
+class UpstreamError(RuntimeError):
+    """OpenWeather answered with an error other than "not found" (401, 5xx still failing after retries)."""
+
+
+def is_country_name(query):
+    return get_gazetteer().is_country(query)
+
+
+def resolve_city(query):
+    """Check a typed name against the gazetteer before anything goes upstream.
+
+    Returns the gazetteer City, or None for a name it doesn't list exactly; that
+    name is looked up upstream as before ("York" is a city even if it looks like
+    "Cork"). With GAZETTEER_STRICT set, such names raise CityNotFoundError instead.
+    """
+    city = get_gazetteer().resolve(query)
+    if city is None and GAZETTEER_STRICT:
+        raise city_not_found(query)
+    return city
+
+
+def city_not_found(query, error=None):
+    """CityNotFoundError for query carrying the gazetteer's "did you mean" suggestions."""
+    return CityNotFoundError(str(error) if error else query, get_gazetteer().suggest(query))
+
+
+# ---- CACHE LAYERS ----
+# memory (weather_cache, per process) -> SQLite store (shared by every process) -> network
+def get_cache_store():
+    """Offline store shared by the whole process; no cache contents are loaded up front."""
+    return open_store(CACHE_DB, legacy_json=CACHE_FILE)
+
+
+def store_offline(key, data, ttl=None):
+    try:
+        with metrics.store_write():
+            get_cache_store().put(key, to_json(data), ttl=ttl)
+    except Exception:
+        pass
+
+
+def load_offline(key):
+    try:
+        return get_cache_store().get(key)
+    except Exception:
+        return None
+
+
+def load_offline_entry(key, model=None):
+    """(data, age_seconds) from the store regardless of freshness, or (None, None).
+    With a model (e.g. CurrentWeather) the stored dict is turned back into that record."""
+    try:
+        data, stored_at = get_cache_store().get_entry(key)
+    except Exception:
+        return None, None
+    if data is not None and model is not None:
+        data = model.from_dict(data)
+    if data is None:
+        return None, None
+    return data, time.time() - stored_at
+
+
+def lookup(endpoint, params, store_key, model=None):
+    """(value, "memory" | "store") for a fresh copy, else (None, "miss")."""
+    cache = shared_cache()
+    value = cache.get(endpoint, params)
+    if value is not None:
+        return value, "memory"
+    value, age = load_offline_entry(store_key, model)
+    if value is not None and age < cache.ttl_for(endpoint):
+        # another worker fetched it recently
+        cache.set(endpoint, params, value, stored_at=time.time() - age)
+        return value, "store"
+    return None, "miss"
+
+
+def cached_lookup(endpoint, params, store_key, model=None):
+    """Fresh value from memory, else from the shared store if younger than the endpoint TTL."""
+    return lookup(endpoint, params, store_key, model)[0]
+
+
+def recorded_lookup(endpoint, params, store_key, model=None):
+    """cached_lookup() that also counts the hit or miss in metrics."""
+    value, source = lookup(endpoint, params, store_key, model)
+    metrics.record_cache(endpoint, source)
+    return value
+
+
+def cached_fetch(endpoint, params, store_key, loader, force=False, store_ttl=None, model=None):
+    """cached_lookup(), falling back to loader(). Non-None loader results are written to both
+    layers. force=True skips the lookup (used by the background refresher)."""
+    if not force:
+        value = recorded_lookup(endpoint, params, store_key, model)
+        if value is not None:
+            return value
+    value = loader()
+    if value is not None:
+        remember(endpoint, params, store_key, value, store_ttl)
+    return value
+
+
+def remember(endpoint, params, store_key, value, store_ttl=None):
+    """Write a freshly loaded value to both cache layers."""
+    shared_cache().set(endpoint, params, value)
+    store_offline(store_key, value, ttl=store_ttl)
+
+
+def latlon_params(lat, lon):
+    return {"lat": float(lat), "lon": float(lon)}
+
+
+def latlon_key(lat, lon):
+    return f"{float(lat):.4f},{float(lon):.4f}"
+
+
+# ---- OPENWEATHER ----
+def quota():
+    return get_scheduler(max(1, int(QUOTA_PER_MINUTE * QUOTA_SHARE)))
+
+
+def openweather_get(path, endpoint, timeout=None, **params):
+    """GET an OpenWeather path through the quota scheduler and the pooled client; return its JSON.
+
+    Concurrent identical requests share one upstream call. Raises RateLimitedError on a 429
+    or when no quota is left.
+    """
+    def load():
+        response = get_client().get(f"{OPENWEATHER_URL}{path}", params=dict(params, appid=API_KEY),
+                                    endpoint=endpoint, timeout=timeout)
+        check_rate_limit(response.status_code, response.headers)
+        return response.json()
+
+    return quota().call(make_key(path, params), load)
+
+
+def check_rate_limit(status, headers):
+    """On a 429, pause the quota scheduler for Retry-After and raise RateLimitedError."""
+    if status == 429:
+        retry_after = quota().note_rate_limited(headers.get("Retry-After"))
+        raise RateLimitedError("OpenWeather returned 429", retry_after=retry_after)
+
+
+class CachedRequest:
+    """One cacheable OpenWeather lookup: where its answer is cached, the request behind it and
+    how the response is parsed. fetch_request() runs it with blocking I/O, and
+    async_fetch.fetch_request() on the event loop, so both share keys and parsing."""
+    __slots__ = ("endpoint", "params", "store_key", "path", "query", "parse", "model", "store_ttl", "loaded")
+
+    def __init__(self, endpoint, params, store_key, path, query, parse, model=None, store_ttl=None, loaded=None):
+        self.endpoint = endpoint
+        self.params = params  # shared-cache key
+        self.store_key = store_key
+        self.path = path
+        self.query = query  # upstream query string, without the API key
+        self.parse = parse
+        self.model = model
+        self.store_ttl = store_ttl
+        self.loaded = loaded  # called (blocking) with every freshly parsed value
+
+
+def fetch_request(request, force=False, timeout=None):
+    """cached_fetch() for a CachedRequest; a miss goes to OpenWeather."""
+    def load():
+        value = request.parse(openweather_get(request.path, request.endpoint, timeout=timeout, **request.query))
+        if value is not None and request.loaded is not None:
+            request.loaded(value)
+        return value
+
+    return cached_fetch(request.endpoint, request.params, request.store_key, load, force=force,
+                        store_ttl=request.store_ttl, model=request.model)
+
+
+def parse_current(city, res):
+    cod = str(res.get("cod"))  # an int on success, a string on errors
+    if cod == "404":
+        raise CityNotFoundError(res.get("message", city))
+    if cod != "200":
+        raise UpstreamError(f"OpenWeather returned {cod}: {res.get('message', '')}")
+    return CurrentWeather.from_api(res)
+
+
+def current_request(city):
+    return CachedRequest("current", {"q": city}, city.title(), "/data/2.5/weather", {"q": city, "units": "metric"},
+                         lambda res: parse_current(city, res), model=CurrentWeather,
+                         # every successful lookup also feeds the geocoding index
+                         loaded=lambda current: remember_coords(city, current.lat, current.lon))
+
+
+def fetch_current(city, timeout=None, force=False):
+    """CurrentWeather for city. Raises CityNotFoundError, UpstreamError, or the network error on failure."""
+    return fetch_request(current_request(city), force, timeout)
+
+
+def peek_current(city):
+    """Fresh current weather if cached anywhere, without touching the network."""
+    return cached_lookup("current", {"q": city}, city.title(), model=CurrentWeather)
+
+
+def stale_current(city):
+    """Best possibly-expired current weather we hold for city: (data, age_seconds) or (None, None)."""
+    res, age = shared_cache().get_stale("current", {"q": city})
+    if res is not None:
+        return res, age
+    return load_offline_entry(city.title(), CurrentWeather)
+
+
+def load_cached_city(city):
+    return load_offline_entry(city.title(), CurrentWeather)[0]
+
+
+ONECALL_PARAMS = {"exclude": "minutely,hourly,alerts", "units": "metric"}
+
+
+def parse_onecall(res):
+    return DailyOutlook.from_api(res) if res and 'daily' in res else None
+
+
+def onecall_request(lat, lon):
+    return CachedRequest("onecall", latlon_params(lat, lon), latlon_key(lat, lon), "/data/2.5/onecall",
+                         dict(lat=lat, lon=lon, **ONECALL_PARAMS), parse_onecall, model=DailyOutlook)
+
+
+def fetch_onecall(lat, lon, force=False):
+    """DailyOutlook (UV now, daily temperatures) for the UV line and the 7-day trend.
+
+    Returns (data, stale): stale is True when the network failed and an older stored copy was used.
+    """
+    try:
+        res = fetch_request(onecall_request(lat, lon), force)
+        if res is not None:
+            return res, False
+    except Exception:
+        pass
+    return stale_onecall(lat, lon)
+
+
+def stale_onecall(lat, lon):
+    """(stored DailyOutlook, True) when the network failed, or (None, False)."""
+    cached = load_offline_entry(latlon_key(lat, lon), DailyOutlook)[0]
+    if not cached:
+        return None, False
+    metrics.record_cache("onecall", "stale")
+    return cached, True
+
+
+AQI_KEYS = {1: 'aqi_good', 2: 'aqi_fair', 3: 'aqi_moderate', 4: 'aqi_poor', 5: 'aqi_very_poor'}
+
+
+def parse_aqi(aqi_res):
+    if aqi_res.get("list"):
+        return aqi_res["list"][0]["main"]["aqi"]
+    return None
+
+
+def aqi_request(lat, lon):
+    return CachedRequest("air_pollution", latlon_params(lat, lon), "aqi:" + latlon_key(lat, lon),
+                         "/data/2.5/air_pollution", {"lat": lat, "lon": lon}, parse_aqi)
+
+
+def fetch_aqi(lat, lon, force=False):
+    """Raw AQI index (1-5) or None."""
+    try:
+        return fetch_request(aqi_request(lat, lon), force)
+    except Exception:
+        return None
+
+
+def parse_forecast(forecast_res):
+    if forecast_res.get("cod") != "200":
+        return None
+    return ForecastSeries.from_api(forecast_res)
+
+
+def forecast_request(city=None, lat=None, lon=None):
+    if city:
+        params, query, store_key = {"q": city}, {"q": city}, "forecast:" + " ".join(city.split()).lower()
+    else:
+        params, query, store_key = latlon_params(lat, lon), {"lat": lat, "lon": lon}, "forecast:" + latlon_key(lat, lon)
+    return CachedRequest("forecast", params, store_key, "/data/2.5/forecast", dict(query, units="metric"),
+                         parse_forecast, model=ForecastSeries)
+
+
+def fetch_forecast(city=None, lat=None, lon=None, force=False):
+    """One /forecast request per city (or lat/lon) per forecast TTL. Returns a ForecastSeries or None."""
+    try:
+        return fetch_request(forecast_request(city, lat, lon), force)
+    except Exception:
+        return None
+
+
+# ---- GEOCODING ----
+def geo_key(name):
+    return "geo:" + " ".join(name.split()).lower()
+
+
+def remember_coords(name, lat, lon):
+    """Record name -> (lat, lon) in the shared cache and the persistent index."""
+    coords = [float(lat), float(lon)]
+    shared_cache().set("geocoding", {"q": name}, coords)
+    store_offline(geo_key(name), coords, ttl=GEOCODE_TTL)
+
+
+def parse_geocode(r):
+    if not (isinstance(r, list) and r):
+        return None
+    return [r[0].get('lat'), r[0].get('lon')]
+
+
+def geocode_request(name):
+    # force=True when fetched: known_coords() has already looked in both cache layers
+    return CachedRequest("geocoding", {"q": name}, geo_key(name), "/geo/1.0/direct", {"q": name, "limit": 1},
+                         parse_geocode, store_ttl=GEOCODE_TTL)
+
+
+def known_coords(name):
+    """(lat, lon) without a network call, or None.
+
+    The coordinates OpenWeather returned for name (remember_coords) come first: pages fetch
+    One Call and AQI at those, and cache_age() reads them, so the refresher must warm the same
+    keys. The gazetteer's rounded coordinates are only the fallback.
+    """
+    coords = recorded_lookup("geocoding", {"q": name}, geo_key(name))
+    if coords:
+        return coords[0], coords[1]
+    city = get_gazetteer().resolve(name)
+    if city is not None:
+        return city.lat, city.lon
+    return None
+
+
+def geocode_city(name):
+    """Resolve a city to (lat, lon): known_coords(), then geo/1.0/direct."""
+    coords = known_coords(name)
+    if coords is not None:
+        return coords
+    coords = fetch_request(geocode_request(name), force=True)
+    if not coords:
+        return None
+    return coords[0], coords[1]
+
+
+# ---- LANDMARK IMAGES (Unsplash) ----
+# Hand-picked landmark photos, seeded into the image index at startup
+KNOWN_CITIES = {
+    "amritsar": "https://images.pexels.com/photos/17798305/pexels-photo-17798305/free-photo-of-golden-temple-at-night.jpeg?auto=compress&cs=tinysrgb&w=800",
+    "delhi": "https://images.pexels.com/photos/3476472/pexels-photo-3476472.jpeg?auto=compress&cs=tinysrgb&w=800",
+    "mumbai": "https://images.pexels.com/photos/10203531/pexels-photo-10203531.jpeg?auto=compress&cs=tinysrgb&w=800",
+    "london": "https://images.pexels.com/photos/460672/pexels-photo-460672.jpeg?auto=compress&cs=tinysrgb&w=800",
+}
+_seeded = False
+_seed_lock = threading.Lock()
+
+
+def image_key(city_name):
+    return "img:" + " ".join(city_name.split()).lower()
+
+
+def seed_image_index():
+    """Once per process: put KNOWN_CITIES into the persistent index unless already there."""
+    global _seeded
+    with _seed_lock:
+        if _seeded:
+            return
+        for city, url in KNOWN_CITIES.items():
+            if load_offline(image_key(city)) is None:
+                store_offline(image_key(city), {"url": url}, ttl=10 * IMAGE_TTL)
+        _seeded = True
+
+
+def unsplash_budget():
+    return get_budget("unsplash", UNSPLASH_BUDGET_PER_HOUR, 3600)
+
+
+def unsplash_params(city_name):
+    return {"query": f"famous landmark in {city_name}", "per_page": 1, "client_id": UNSPLASH_ACCESS_KEY}
+
+
+def parse_unsplash(data):
+    if data.get('results'):
+        return {"url": data['results'][0]['urls']['regular']}
+    return {"url": None}
+
+
+def lookup_image(city_name):
+    """(entry, "memory" | "store") for a city's photo entry, else (None, "miss")."""
+    entry = shared_cache().get("unsplash", {"q": city_name})
+    if entry is not None:
+        return entry, "memory"
+    entry = load_offline(image_key(city_name))
+    if entry is None:
+        return None, "miss"
+    if entry.get("url"):
+        shared_cache().set("unsplash", {"q": city_name}, entry)
+    return entry, "store"
+
+
+def remember_image(city_name, entry):
+    store_offline(image_key(city_name), entry, ttl=IMAGE_TTL if entry["url"] else IMAGE_NEGATIVE_TTL)
+    if entry.get("url"):
+        # negative answers stay only in the store, which expires them after a day
+        shared_cache().set("unsplash", {"q": city_name}, entry)
+
+
+def image_url(city_name, entry):
+    url = entry.get("url") if entry else None
+    return url or KNOWN_CITIES.get(city_name.lower(), None)
+
+
+# ---- Clothing suggestion & UV advice ----
+def clothing_suggestion(temp_c, humidity, wind_speed):
+    tips = []
+    try:
+        t = float(temp_c)
+    except Exception:
+        return "No suggestion available."
+
+    if t <= 5:
+        tips.append("Heavy winter jacket, gloves, warm hat.")
+    elif t <= 15:
+        tips.append("Jacket or sweater; layers recommended.")
+    elif t <= 25:
+        tips.append("Light jacket or long sleeves.")
+    else:
+        tips.append("T-shirt / light clothing; stay hydrated.")
+
+    # humidity/wind modifiers
+    try:
+        h = float(humidity)
+        w = float(wind_speed)
+        if h >= 80 and t >= 20:
+            tips.append("High humidity — breathable fabrics recommended.")
+        if w >= 10 and t <= 15:
+            tips.append("Windy — consider a windbreaker.")
+    except Exception:
+        pass
+
+    return " ".join(tips)
+
+
+def uv_level(uvi):
+    """Translation key for a UV index (uv_low .. uv_extreme), or None if unknown."""
+    try:
+        u = float(uvi)
+    except Exception:
+        return None
+    if u < 3:
+        return "uv_low"
+    elif u < 6:
+        return "uv_moderate"
+    elif u < 8:
+        return "uv_high"
+    elif u < 11:
+        return "uv_very_high"
+    else:
+        return "uv_extreme"
+
+
+# ---- CITY BUNDLE (everything one page needs; fetched concurrently by async_fetch) ----
+def bundle_query(city):
+    """The name a bundle is fetched under: the gazetteer's canonical form when it knows the city.
+    Raises CityNotFoundError for unlisted names with GAZETTEER_STRICT (see resolve_city)."""
+    match = resolve_city(city)
+    return get_gazetteer().query_for(match) if match is not None else city
+
+
+def bundle_json(city, current, aqi, onecall, forecast, image):
+    """The records of one city page as plain JSON (the /v1/weather body)."""
+    onecall, onecall_stale = onecall or (None, False)
+    uvi = onecall.uvi if onecall else None
+    return {
+        "city": current.name or city.title(),
+        "current": current.to_dict(),
+        "aqi": aqi,
+        "aqi_key": AQI_KEYS.get(aqi),
+        "uvi": uvi,
+        "uv_level": uv_level(uvi),
+        "clothing": clothing_suggestion(current.temp, current.humidity, current.wind_speed),
+        "daily": to_json(onecall),
+        "onecall_stale": onecall_stale,
+        "forecast": to_json(forecast),
+        "forecast_daily": to_json(forecast.daily()) if forecast else None,
+        "image_url": image,
+    }
+
+
+# ---- BACKGROUND REFRESH (keeps hot cities and favourites warm) ----
+# These run on the prefetch thread: always go to the network, then update both cache layers.
+def refresh_current(city):
+    fetch_current(city, force=True)
+    return True
+
+
+def refresh_forecast(city):
+    return fetch_forecast(city, force=True) is not None
+
+
+def refresh_onecall(city):
+    coords = geocode_city(city)
+    if not coords:
+        return False
+    res, stale = fetch_onecall(*coords, force=True)
+    return res is not None and not stale
+
+
+def refresh_aqi(city):
+    coords = geocode_city(city)
+    if not coords:
+        return False
+    return fetch_aqi(*coords, force=True) is not None
+
+
+# current first: it records the coordinates the lat/lon endpoints need.
+# Refreshes are background work for the quota scheduler: they never queue and leave a reserve.
+PREFETCH_TASKS = {
+    "current": as_background(refresh_current),
+    "forecast": as_background(refresh_forecast),
+    "onecall": as_background(refresh_onecall),
+    "air_pollution": as_background(refresh_aqi),
+}
+
+
+def cache_age(endpoint, city):
+    """Age of the shared-cache entry a page would read for this city, or None if absent."""
+    if endpoint in ("current", "forecast"):
+        params = {"q": city}
+    else:
+        coords = shared_cache().get("geocoding", {"q": city})
+        if coords is None:
+            return None
+        params = latlon_params(*coords)
+    return shared_cache().get_stale(endpoint, params)[1]
+
+
+def get_prefetcher():
+    return get_refresher(
+        PREFETCH_TASKS, cache_age, shared_cache().ttl_for,
+        top_n=int(os.environ.get("PREFETCH_TOP_N", TOP_N)),
+        budget_per_minute=int(os.environ.get("PREFETCH_BUDGET_PER_MINUTE", BUDGET_PER_MINUTE)),
+    )